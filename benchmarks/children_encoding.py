@@ -0,0 +1,76 @@
+"""Benchmark of building and encoding large Children payloads.
+
+Compares the nested dicts the blocks used to be built as, encoded with
+json.dumps, to the compact TextBlock objects encoded by encode_body.
+
+    python -m benchmarks.children_encoding --blocks 10000
+
+@author: @steppf
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from src.notion_database.children import Children
+from src.notion_database.request import encode_body
+
+TEXT = "Attention is all you need, and some more words to look like a sentence. "
+
+
+def build_dicts(count: int) -> bytes:
+    blocks = []
+    for i in range(count):
+        blocks.append(
+            {
+                "object": "block",
+                "type": "paragraph",
+                "paragraph": {
+                    "rich_text": [
+                        {"type": "text", "text": {"content": f"{i} {TEXT}"}}
+                    ]
+                },
+            }
+        )
+    return json.dumps({"children": blocks}).encode()
+
+
+def build_compact(count: int) -> bytes:
+    children = Children()
+    for i in range(count):
+        children.set_paragraph(f"{i} {TEXT}")
+    return encode_body({"children": children.result})
+
+
+def measure(build, count: int, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(count)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    build(count)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best_ms": min(timings) * 1000, "peak_kib": peak / 1024}
+
+
+def main():
+    """Compare dict and compact block payloads."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--blocks", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    assert json.loads(build_dicts(3)) == json.loads(build_compact(3))
+    report = {
+        "blocks": args.blocks,
+        "dicts": measure(build_dicts, args.blocks, args.repeat),
+        "compact": measure(build_compact, args.blocks, args.repeat),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
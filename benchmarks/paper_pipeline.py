@@ -0,0 +1,408 @@
+"""Offline benchmark of the extraction and Notion write paths.
+
+Papers are fetched from the HTML fixtures of benchmarks/fixtures, one per
+provider of src/parsers, and pages are created on a fake Notion API answering
+from a transport adapter: nothing leaves the process. Every stage is timed for
+1, 10 and 1000 papers, then run again under tracemalloc for the peak of the
+memory allocated by a call:
+
+- fetch: PaperParser, the head-only GET and the meta indexing
+- extract_props: PaperParser.extract_props
+- generate_notion_properties: NotionUpdater.generate_notion_properties
+- create_page: Page.create_page, from the encoding to the decoded response
+
+The head-only download of a page keeps its connection when the rest of the body
+is small enough to drain. head_drain measures that trade-off against a local
+keep-alive server that delays new connections (the TCP+TLS handshake of a
+distant publisher) and throttles the bandwidth: for pages of several sizes and
+several drain thresholds it reports the connections opened, the latency of a
+fetch and the bytes downloaded.
+
+The report is JSON, to compare runs across versions:
+
+    python -m benchmarks.paper_pipeline --output bench.json
+
+@author: @steppf
+"""
+import argparse
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+# no response cache, every paper is fetched
+os.environ["PAPER_CACHE_DIR"] = ""
+
+import requests
+from requests.adapters import BaseAdapter
+
+from src.notion_database.page import Page
+from src.notion_database.rate_limit import get_rate_limiter
+from src.notion_updater import NotionSettings, NotionUpdater
+from src.parser import PaperParser
+from src.utils.request_utils import (
+    DEFAULT_HEAD_DRAIN_MAX_BYTES,
+    DefaultSession,
+    get_session_manager,
+)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+DEFAULT_SIZES = (1, 10, 1000)
+DEFAULT_BODY_KIB = 200
+# head_drain: page sizes, drain thresholds (None: always drained) and fetches
+DRAIN_BODY_KIB = (8, 64, 200)
+DRAIN_THRESHOLDS = (0, DEFAULT_HEAD_DRAIN_MAX_BYTES, None)
+DEFAULT_DRAIN_FETCHES = 20
+DEFAULT_HANDSHAKE_MS = 30
+DEFAULT_BANDWIDTH_KIB_S = 5000
+NOTION_TOKEN = "secret_benchmark"
+DATABASE_ID = "0" * 32
+# paper URLs of every provider, {i} makes them unique
+PAPER_URLS = {
+    "arxiv": "https://arxiv.org/abs/2101.{i:05d}",
+    "acm": "https://dl.acm.org/doi/10.1145/3543507.{i}",
+    "pnas": "https://www.pnas.org/doi/10.1073/pnas.{i}",
+    "openreview": "https://openreview.net/forum?id=bench{i}",
+}
+
+logger = logging.getLogger("benchmark")
+
+
+class StaticAdapter(BaseAdapter):
+    """Transport adapter answering every request with a response of respond"""
+
+    def __init__(self, respond):
+        super().__init__()
+        self.respond = respond
+
+    def send(self, request, **kwargs):
+        status, headers, content = self.respond(request)
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        response.encoding = None
+        return response
+
+    def close(self):
+        pass
+
+
+def fixture_responder(fixtures, body_kib):
+    """
+    Serve the fixture of the provider of the requested host
+
+    The body is padded to body_kib KiB, so the head-only download has the rest
+    of a page to skip.
+    """
+    pages = {name: pad_page(html, body_kib) for name, html in fixtures.items()}
+
+    def respond(request):
+        host = urlparse(request.url).hostname
+        name = next(name for name in pages if name in host)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, pages[name]
+
+    return respond
+
+
+def notion_responder(request):
+    """Created page objects, like POST /v1/pages of the Notion API"""
+    page = {
+        "object": "page",
+        "id": str(uuid.uuid4()),
+        "parent": {"type": "database_id", "database_id": DATABASE_ID},
+        "properties": json.loads(request.body)["properties"],
+    }
+    return 200, {"Content-Type": "application/json"}, json.dumps(page).encode()
+
+
+def pad_page(html, body_kib):
+    """Pad a fixture to body_kib KiB, about the size of a real article page"""
+    padding = b"<p>" + b"lorem ipsum " * (body_kib * 1024 // 12) + b"</p>\n"
+    return html.replace(b"</body>", padding + b"</body>")
+
+
+class ThrottledServer:
+    """
+    Local keep-alive HTTP server of a single page, slowed down like a distant
+    publisher: every new connection waits handshake_ms and the body is sent at
+    bandwidth_kib_s
+    """
+
+    def __init__(self, page, handshake_ms, bandwidth_kib_s):
+        self.connections = 0
+        self.bytes_sent = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # like real servers, or the body waits for the ACK of the headers
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                server.connections += 1
+                time.sleep(handshake_ms / 1000)
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                chunk_size = 16 * 1024
+                try:
+                    for start in range(0, len(page), chunk_size):
+                        chunk = page[start : start + chunk_size]
+                        self.wfile.write(chunk)
+                        server.bytes_sent += len(chunk)
+                        time.sleep(len(chunk) / 1024 / bandwidth_kib_s)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client closed the connection after the head
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/paper"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure_head_drain(fetches, handshake_ms, bandwidth_kib_s):
+    """
+    Head-only fetches of pages of every DRAIN_BODY_KIB size with every drain
+    threshold, the connections they open and the time they take
+    """
+    html = load_fixtures()["arxiv"]
+    report = {}
+    for body_kib in DRAIN_BODY_KIB:
+        page = pad_page(html, body_kib)
+        runs = {}
+        for threshold in DRAIN_THRESHOLDS:
+            server = ThrottledServer(page, handshake_ms, bandwidth_kib_s)
+            session = DefaultSession(
+                max_retries=0,
+                head_drain_max_bytes=len(page) if threshold is None else threshold,
+            )
+            latencies = []
+            try:
+                for _ in range(fetches):
+                    start = time.perf_counter()
+                    session.get(server.url, head_only=True, timeout=30)
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                session.close()
+                server.stop()
+            key = "always" if threshold is None else str(threshold)
+            runs[key] = {
+                "connections": server.connections,
+                "mean_ms": statistics.mean(latencies) * 1000,
+                "p95_ms": sorted(latencies)[int(0.95 * (fetches - 1))] * 1000,
+                "sent_kib": server.bytes_sent / 1024,
+            }
+        report[f"{len(page) // 1024}KiB"] = runs
+    return report
+
+
+def load_fixtures():
+    return {path.stem: path.read_bytes() for path in FIXTURES_DIR.glob("*.html")}
+
+
+def paper_urls(count):
+    providers = itertools.cycle(PAPER_URLS.values())
+    return [next(providers).format(i=i) for i in range(count)]
+
+
+def install_transports(body_kib):
+    """Mount the fixture and fake Notion adapters on the shared sessions"""
+    fixtures = load_fixtures()
+    adapter = StaticAdapter(fixture_responder(fixtures, body_kib))
+    for url in PAPER_URLS.values():
+        session = get_session_manager().session(url.format(i=0))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    page = Page(NOTION_TOKEN)
+    page.request.session.mount("https://", StaticAdapter(notion_responder))
+
+
+def run_stages(urls, trace=False):
+    """
+    Run every stage on urls, returns the per paper latencies of the stages, or
+    with trace the peak of the memory allocated by each call (tracemalloc)
+    """
+    updater = NotionUpdater(
+        NotionSettings(
+            api_key=NOTION_TOKEN,
+            page_url=f"https://www.notion.so/{DATABASE_ID}",
+            database_id=DATABASE_ID,
+            pool_size=10,
+            timeout=(5, 30),
+            rate_limit=1e9,
+            schema_ttl=300,
+        )
+    )
+    page = Page(NOTION_TOKEN)
+    latencies = {
+        "fetch": [],
+        "extract_props": [],
+        "generate_notion_properties": [],
+        "create_page": [],
+    }
+
+    def timed(stage, function, *args):
+        if trace:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = function(*args)
+            latencies[stage].append(tracemalloc.get_traced_memory()[1] - before)
+            return result
+        start = time.perf_counter()
+        result = function(*args)
+        latencies[stage].append(time.perf_counter() - start)
+        return result
+
+    for url in urls:
+        parser = timed("fetch", PaperParser, url, logger)
+        props = timed("extract_props", parser.extract_props)
+        properties = timed(
+            "generate_notion_properties",
+            updater.generate_notion_properties,
+            props,
+            "benchmark",
+        )
+        timed("create_page", page.create_page, DATABASE_ID, properties)
+    return latencies
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        "total_s": total,
+        "mean_ms": total / len(ordered) * 1000,
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+        "papers_per_s": len(ordered) / total if total else None,
+    }
+
+
+def measure(count):
+    urls = paper_urls(count)
+    latencies = run_stages(urls)
+    report = {stage: summarize(values) for stage, values in latencies.items()}
+    report["pipeline"] = summarize([sum(paper) for paper in zip(*latencies.values())])
+
+    # allocations are measured apart, tracemalloc slows everything down
+    tracemalloc.start()
+    peaks = run_stages(urls, trace=True)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for stage, values in peaks.items():
+        report[stage]["peak_alloc_kib"] = max(values) / 1024
+    report["pipeline"]["peak_alloc_kib"] = peak / 1024
+    report["pipeline"]["retained_kib"] = current / 1024
+    # high-water mark of the process so far, KiB on Linux
+    report["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Benchmark the extraction and Notion write paths offline."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--papers", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument(
+        "--body-kib",
+        type=int,
+        default=DEFAULT_BODY_KIB,
+        help="size the fixture pages are padded to",
+    )
+    parser.add_argument(
+        "--drain-fetches",
+        type=int,
+        default=DEFAULT_DRAIN_FETCHES,
+        help="head-only fetches per page size and threshold of head_drain, 0 to skip",
+    )
+    parser.add_argument(
+        "--handshake-ms",
+        type=float,
+        default=DEFAULT_HANDSHAKE_MS,
+        help="delay of a new connection in head_drain",
+    )
+    parser.add_argument(
+        "--bandwidth-kib-s",
+        type=float,
+        default=DEFAULT_BANDWIDTH_KIB_S,
+        help="download speed in head_drain",
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # the benchmark measures the client, not the pace Notion allows
+    get_rate_limiter(NOTION_TOKEN, rate=1e9, burst=1_000_000)
+    install_transports(args.body_kib)
+    # warm up imports, the registry and the sessions
+    run_stages(paper_urls(len(PAPER_URLS)))
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "body_kib": args.body_kib,
+        "runs": {str(count): measure(count) for count in args.papers},
+    }
+    if args.drain_fetches:
+        report["head_drain"] = {
+            "handshake_ms": args.handshake_ms,
+            "bandwidth_kib_s": args.bandwidth_kib_s,
+            "pages": measure_head_drain(
+                args.drain_fetches, args.handshake_ms, args.bandwidth_kib_s
+            ),
+        }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from src.importer import (
+    DEFAULT_EXTRACTION_WORKERS,
+    DEFAULT_WRITE_WORKERS,
+    BulkImporter,
+    read_reading_list,
+)
+from src.notion_updater import NotionUpdater, env_file
+from src.paper_index import DEFAULT_PAPER_INDEX_PATH, PaperIndex
+from src.pipeline_state import DEFAULT_PIPELINE_STATE_PATH, PipelineState
+
+
+def main():
+    """Import a reading list (BibTeX, Zotero CSV or a list of URLs/DOIs) to Notion."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("path", help="reading list to import")
+    parser.add_argument("--added-by", default="Bulk import")
+    parser.add_argument(
+        "--extraction-workers", type=int, default=DEFAULT_EXTRACTION_WORKERS
+    )
+    parser.add_argument("--write-workers", type=int, default=DEFAULT_WRITE_WORKERS)
+    parser.add_argument(
+        "--run-id",
+        help="checkpoint id of the import, running it again resumes it "
+        "(default: the path of the reading list)",
+    )
+    args = parser.parse_args()
+
+    load_dotenv(env_file())
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    logger = logging.getLogger("import_papers")
+
+    with open(args.path, encoding="utf-8") as f:
+        references = read_reading_list(f.read(), filename=args.path)
+    logger.info(f"Importing {len(references)} papers from {args.path}")
+
+    importer = BulkImporter(
+        NotionUpdater(),
+        PaperIndex(os.getenv("PAPER_INDEX_PATH", DEFAULT_PAPER_INDEX_PATH)),
+        added_by=args.added_by,
+        extraction_workers=args.extraction_workers,
+        write_workers=args.write_workers,
+        on_progress=lambda progress: logger.info(str(progress)),
+        state=PipelineState(
+            os.getenv("PIPELINE_STATE_PATH", DEFAULT_PIPELINE_STATE_PATH)
+        ),
+    )
+    progress = importer.run(
+        references, run_id=args.run_id or os.path.abspath(args.path)
+    )
+
+    for reference, error in progress.failures:
+        logger.error(f"Failed: {reference}: {error}")
+    logger.info(f"Done: {progress}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Bulk import of reading lists into Notion.
+
+Reads BibTeX files, Zotero CSV exports or plain lists of URLs/DOIs/arXiv IDs,
+extracts the papers concurrently and writes them to Notion as fast as the Notion
+rate limiter allows. Papers already in the PaperIndex are skipped and, given a
+PipelineState and a run id, every stage is checkpointed so an interrupted import
+resumes where it stopped.
+
+@author: @steppf
+"""
+import csv
+import io
+import logging
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from src.notion_updater import NotionUpdater
+from src.paper_index import PaperIndex, keys_for_props, keys_for_url
+from src.parser import get_arxiv_papers_props, get_paper_props
+from src.parsers.registry import get_registry
+from src.pipeline_state import FAILED, PARSED, WRITING, WRITTEN, PipelineState
+from src.utils.parser_utils import extract_arxiv_id, extract_doi
+
+DEFAULT_EXTRACTION_WORKERS = 8
+# writers only need to keep the Notion rate limiter busy
+DEFAULT_WRITE_WORKERS = 4
+ARXIV_BATCH_SIZE = 50
+
+BIBTEX_FIELD_REGEX = re.compile(
+    r"\b(url|doi|eprint)\s*=\s*[{\"]\s*([^}\"]+?)\s*[}\"]", re.IGNORECASE
+)
+
+logger = logging.getLogger(__name__)
+
+
+def reference_to_url(reference: str) -> str:
+    """Turn a URL, DOI or arXiv identifier into the URL of a paper page
+
+    Args:
+        reference (str): a URL, a DOI, "arXiv:1706.03762" or a bare arXiv ID
+    Returns:
+        str: a URL served by one of the registered providers
+    """
+    reference = reference.strip()
+    registry = get_registry()
+    if reference.startswith(("http://", "https://")):
+        doi = extract_doi(reference)
+        if "doi.org/" in reference and doi:
+            return registry.url_for_doi(doi)
+        registry.resolve(reference)
+        return reference
+
+    arxiv_id = extract_arxiv_id(reference) or extract_arxiv_id(f"arXiv:{reference}")
+    if arxiv_id and not extract_doi(reference):
+        return f"https://arxiv.org/abs/{arxiv_id}"
+
+    doi = extract_doi(reference)
+    if doi:
+        return registry.url_for_doi(doi)
+    raise ValueError(f"Not a URL, DOI or arXiv ID: {reference}")
+
+
+def _first_resolvable(candidates: list[str]) -> Optional[str]:
+    for candidate in candidates:
+        try:
+            reference_to_url(candidate)
+            return candidate
+        except ValueError:
+            continue
+    return candidates[0] if candidates else None
+
+
+def _parse_bibtex(text: str) -> list[str]:
+    references = []
+    for entry in re.split(r"^\s*@", text, flags=re.MULTILINE)[1:]:
+        fields = {}
+        for name, value in BIBTEX_FIELD_REGEX.findall(entry):
+            fields.setdefault(name.lower(), value)
+        reference = _first_resolvable(
+            [fields[name] for name in ("url", "eprint", "doi") if name in fields]
+        )
+        if reference:
+            references.append(reference)
+    return references
+
+
+def _parse_zotero_csv(text: str) -> list[str]:
+    references = []
+    for row in csv.DictReader(io.StringIO(text)):
+        reference = _first_resolvable(
+            [row[column] for column in ("Url", "DOI") if row.get(column)]
+        )
+        if reference:
+            references.append(reference)
+    return references
+
+
+def read_reading_list(text: str, filename: str = "") -> list[str]:
+    """Extract the paper references of a reading list
+
+    Args:
+        text (str): content of a BibTeX file, a Zotero CSV export or a list with
+            one URL, DOI or arXiv ID per line
+        filename (str): used to recognize the format
+    Returns:
+        list[str]: distinct references, in order
+    """
+    filename = filename.lower()
+    if filename.endswith(".bib") or text.lstrip().startswith("@"):
+        references = _parse_bibtex(text)
+    elif filename.endswith(".csv"):
+        references = _parse_zotero_csv(text)
+    else:
+        references = [
+            line.strip()
+            for line in text.splitlines()
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+    return list(dict.fromkeys(references))
+
+
+class ImportProgress:
+    """Counters of a running import"""
+
+    def __init__(self, total: int = 0) -> None:
+        self.total = total
+        self.saved = 0
+        self.skipped = 0
+        self.failures: list[tuple[str, str]] = []
+
+    @property
+    def failed(self) -> int:
+        return len(self.failures)
+
+    @property
+    def done(self) -> int:
+        return self.saved + self.skipped + self.failed
+
+    def __str__(self) -> str:
+        return (
+            f"{self.done}/{self.total} papers: {self.saved} saved, "
+            f"{self.skipped} already saved, {self.failed} failed"
+        )
+
+
+class BulkImporter:
+    """Concurrent extract → dedup → write pipeline for many papers"""
+
+    def __init__(
+        self,
+        updater: NotionUpdater,
+        paper_index: PaperIndex,
+        added_by: str,
+        extraction_workers: int = DEFAULT_EXTRACTION_WORKERS,
+        write_workers: int = DEFAULT_WRITE_WORKERS,
+        on_progress: Optional[Callable[[ImportProgress], None]] = None,
+        state: Optional[PipelineState] = None,
+    ) -> None:
+        self.updater = updater
+        self.paper_index = paper_index
+        self.added_by = added_by
+        self.extraction_workers = extraction_workers
+        self.write_workers = write_workers
+        self.on_progress = on_progress
+        self.state = state
+        self.run_id = None
+        self._lock = threading.Lock()
+
+    def _checkpoint(self, stage: str, url: str, *args) -> None:
+        if self.state is not None and self.run_id is not None:
+            getattr(self.state, f"mark_{stage}")(self.run_id, url, *args)
+
+    def _report(
+        self, progress: ImportProgress, outcome: str, reference: str, error=None
+    ) -> None:
+        with self._lock:
+            if outcome == "saved":
+                progress.saved += 1
+            elif outcome == "skipped":
+                progress.skipped += 1
+            else:
+                logger.error(f"Could not import {reference}: {error!r}")
+                progress.failures.append((reference, str(error)))
+        if self.on_progress is not None:
+            self.on_progress(progress)
+
+    def _write(self, url: str, paper_props: dict[str, str]) -> bool:
+        """Create the page of a paper, False when it is already saved"""
+        if self.paper_index.lookup_keys(keys_for_props(paper_props)) is not None:
+            return False
+        self._checkpoint("writing", url)
+        try:
+            page = self.updater.update(paper_props, added_by=self.added_by)
+        except Exception as e:
+            self._checkpoint("failed", url, repr(e))
+            raise
+        self.paper_index.add_page(paper_props, page.result)
+        self._checkpoint("written", url, page.result["id"], page.result["url"])
+        return True
+
+    def _resume(self, url: str) -> tuple[bool, Optional[dict]]:
+        """Restore the checkpoint of a URL
+
+        Args:
+            url (str): the paper URL
+        Returns:
+            tuple[bool, dict]: whether the paper is already written, and its
+                properties when only the write is left
+        """
+        item = self.state.get(self.run_id, url) if self.state is not None else None
+        if item is None or self.run_id is None:
+            self._checkpoint("pending", url)
+            return False, None
+        if item.stage == WRITTEN:
+            return True, None
+        if item.stage in (WRITING, FAILED) and item.paper_props:
+            # the page may have been created right before a crash, or by a
+            # create that failed once Notion had carried it out
+            page = self.updater.find_page(url)
+            if page is not None:
+                self.paper_index.add(
+                    keys_for_props(item.paper_props),
+                    page["id"],
+                    page["url"],
+                    item.paper_props["title"],
+                )
+                self._checkpoint("written", url, page["id"], page["url"])
+                return True, None
+        if item.stage in (PARSED, WRITING, FAILED) and item.paper_props:
+            return False, item.paper_props
+        return False, None
+
+    def run(self, references: list[str], run_id: str = None) -> ImportProgress:
+        """Import papers
+
+        Args:
+            references (list[str]): URLs, DOIs or arXiv IDs
+            run_id (str): checkpoint the run under this id, running again with
+                the same id resumes it
+        Returns:
+            ImportProgress: the final counters and failures
+        """
+        self.run_id = run_id
+        progress = ImportProgress(total=len(references))
+        urls = {}
+        parsed = {}
+        # index keys of the papers already scheduled, arXiv abs and pdf links or
+        # URLs differing only in tracking parameters are the same paper
+        seen_keys = set()
+        for reference in references:
+            try:
+                url = reference_to_url(reference)
+            except ValueError as e:
+                self._report(progress, "failed", reference, e)
+                continue
+            keys = keys_for_url(url)
+            saved = self.paper_index.lookup_keys(keys)
+            if saved is not None or not seen_keys.isdisjoint(keys):
+                self._report(progress, "skipped", reference)
+                continue
+            seen_keys.update(keys)
+            try:
+                written, paper_props = self._resume(url)
+            except Exception as e:
+                self._report(progress, "failed", reference, e)
+                continue
+            if written:
+                self._report(progress, "skipped", reference)
+                continue
+            urls[url] = reference
+            if paper_props is not None:
+                parsed[url] = paper_props
+
+        with ThreadPoolExecutor(
+            self.extraction_workers, thread_name_prefix="import-extraction"
+        ) as extraction_pool, ThreadPoolExecutor(
+            self.write_workers, thread_name_prefix="import-write"
+        ) as write_pool:
+            # future -> (kind, urls)
+            pending = {}
+            written_keys = set()
+
+            def write(url, paper_props):
+                # two links may only turn out to be the same paper once parsed,
+                # e.g. a doi.org link and the publisher page
+                keys = keys_for_props(paper_props)
+                if not written_keys.isdisjoint(keys):
+                    self._report(progress, "skipped", urls[url])
+                    return
+                written_keys.update(keys)
+                future = write_pool.submit(self._write, url, paper_props)
+                pending[future] = ("write", [url])
+
+            def extract(url):
+                future = extraction_pool.submit(get_paper_props, url, logger)
+                pending[future] = ("extract", [url])
+
+            for url, paper_props in parsed.items():
+                write(url, paper_props)
+
+            arxiv_urls = [
+                url for url in urls if url not in parsed and extract_arxiv_id(url)
+            ]
+            for start in range(0, len(arxiv_urls), ARXIV_BATCH_SIZE):
+                batch = arxiv_urls[start : start + ARXIV_BATCH_SIZE]
+                future = extraction_pool.submit(get_arxiv_papers_props, batch, logger)
+                pending[future] = ("arxiv", batch)
+            for url in urls.keys() - parsed.keys() - set(arxiv_urls):
+                extract(url)
+
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    kind, batch = pending.pop(future)
+                    if kind == "arxiv":
+                        papers_props = future.result()
+                        for url in batch:
+                            if url in papers_props:
+                                self._checkpoint("parsed", url, papers_props[url])
+                                write(url, papers_props[url])
+                            else:
+                                extract(url)
+                        continue
+
+                    (url,) = batch
+                    error = future.exception()
+                    if error is not None:
+                        if kind == "extract":
+                            self._checkpoint("failed", url, repr(error))
+                        self._report(progress, "failed", urls[url], error)
+                    elif kind == "extract":
+                        self._checkpoint("parsed", url, future.result())
+                        write(url, future.result())
+                    else:
+                        outcome = "saved" if future.result() else "skipped"
+                        self._report(progress, outcome, urls[url])
+
+        return progress
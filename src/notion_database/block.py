@@ -0,0 +1,252 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from src.notion_database.children import Children
+from src.notion_database.request import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_TIMEOUT,
+    AsyncRequest,
+    Request,
+    get_base_url,
+)
+
+LOGGER = logging.getLogger("Notion-Database")
+
+# https://developers.notion.com/reference/request-limits
+MAX_CHILDREN = 100
+# parents appended to at the same time by append_children_many
+DEFAULT_APPEND_WORKERS = 4
+
+
+class Block:
+    def __init__(
+        self, integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+    ):
+        """
+        init
+
+        :param integrations_token: Notion Internal Integration Token
+        :param timeout: requests timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared session
+        """
+        self.url = get_base_url() + "/blocks"
+        self.result = {}
+        self.request = Request(
+            self.url,
+            integrations_token=integrations_token,
+            timeout=timeout,
+            pool_size=pool_size,
+        )
+
+    def retrieve_block(self, block_id):
+        """
+        Retrieve a block
+
+        :param block_id: Identifier for a Notion block or page
+        :return:
+        """
+        self.result = self.request.call_api_get(self.url + "/" + block_id)
+        self._check_error(self.result)
+
+    def retrieve_children(self, block_id, page_size=100, start_cursor=None):
+        """
+        Retrieve one page of the children of a block
+
+        :param block_id: Identifier for a Notion block or page
+        :param page_size: The number of items from the full list desired in the response.
+        :param start_cursor: returns a page of results starting after the cursor provided.
+        :return:
+        """
+        url = self.url + "/" + block_id + f"/children?page_size={page_size}"
+        if start_cursor:
+            url += f"&start_cursor={start_cursor}"
+        self.result = self.request.call_api_get(url)
+        self._check_error(self.result)
+
+    def append_children(self, block_id, children, after=None):
+        """
+        Append blocks to a block or page, MAX_CHILDREN blocks per request
+
+        Batches are sent one after the other so the blocks keep their order. The
+        responses are not kept in result, so that concurrent appends do not mix.
+
+        :param block_id: Identifier for a Notion block or page
+        :param children: Children or list of block objects
+        :param after: Identifier of the existing child to append after, appended
+            at the end if not given
+        :return: ids of the created blocks, in order
+        """
+        ids = []
+        for blocks in self._batches(children):
+            result = self.request.call_api_patch(
+                self._children_url(block_id),
+                self._append_body(blocks, after),
+                idempotent=False,
+            )
+            after = self._created_ids(result, ids, after)
+        return ids
+
+    def append_children_many(self, appends, max_workers=DEFAULT_APPEND_WORKERS):
+        """
+        Append blocks to several blocks or pages, the parents are appended to
+        concurrently
+
+        :param appends: dict of block id to Children or list of block objects
+        :param max_workers: maximum number of parents appended to at once
+        :return: dict of block id to the ids of its created blocks
+        """
+        with ThreadPoolExecutor(max_workers, thread_name_prefix="append") as pool:
+            futures = {
+                block_id: pool.submit(self.append_children, block_id, children)
+                for block_id, children in appends.items()
+            }
+        return {block_id: future.result() for block_id, future in futures.items()}
+
+    def _children_url(self, block_id):
+        return self.url + "/" + block_id + "/children"
+
+    @staticmethod
+    def _batches(children):
+        """
+        Split blocks in batches Notion accepts in a single request
+
+        :param children: Children or list of block objects
+        :return: list of lists of block objects
+        """
+        blocks = children.result if isinstance(children, Children) else children
+        return [
+            blocks[start : start + MAX_CHILDREN]
+            for start in range(0, len(blocks), MAX_CHILDREN)
+        ]
+
+    @staticmethod
+    def _append_body(blocks, after=None):
+        """
+        Build the body of an append block children request
+
+        :param blocks: at most MAX_CHILDREN block objects
+        :param after: Identifier of the existing child to append after
+        :return:
+        """
+        body = {"children": blocks}
+        if after is not None:
+            body["after"] = after
+        return body
+
+    @classmethod
+    def _created_ids(cls, result, ids, after):
+        """
+        Collect the ids of the blocks created by an append request
+
+        :param result: decoded Notion response
+        :param ids: list the ids are added to
+        :param after: position of the request
+        :return: position of the next batch
+        """
+        cls._check_error(result)
+        created = [block["id"] for block in result["results"]]
+        ids.extend(created)
+        # without after, Notion appends at the end already
+        return created[-1] if after is not None and created else after
+
+    @staticmethod
+    def _check_error(result):
+        """
+        Raise on a Notion error object
+
+        :param result: decoded Notion response
+        :return:
+        """
+        if result["object"] == "error":
+            LOGGER.error(result["message"])
+            raise ValueError(result["code"])
+
+
+class AsyncBlock(Block):
+    def __init__(
+        self, integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+    ):
+        """
+        init
+
+        :param integrations_token: Notion Internal Integration Token
+        :param timeout: httpx timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared client
+        """
+        self.url = get_base_url() + "/blocks"
+        self.result = {}
+        self.request = AsyncRequest(
+            self.url,
+            integrations_token=integrations_token,
+            timeout=timeout,
+            pool_size=pool_size,
+        )
+
+    async def retrieve_block(self, block_id):
+        """
+        Retrieve a block
+
+        :param block_id: Identifier for a Notion block or page
+        :return:
+        """
+        self.result = await self.request.call_api_get(self.url + "/" + block_id)
+        self._check_error(self.result)
+
+    async def retrieve_children(self, block_id, page_size=100, start_cursor=None):
+        """
+        Retrieve one page of the children of a block
+
+        :param block_id: Identifier for a Notion block or page
+        :param page_size: The number of items from the full list desired in the response.
+        :param start_cursor: returns a page of results starting after the cursor provided.
+        :return:
+        """
+        url = self.url + "/" + block_id + f"/children?page_size={page_size}"
+        if start_cursor:
+            url += f"&start_cursor={start_cursor}"
+        self.result = await self.request.call_api_get(url)
+        self._check_error(self.result)
+
+    async def append_children(self, block_id, children, after=None):
+        """
+        Append blocks to a block or page, MAX_CHILDREN blocks per request
+
+        Batches are sent one after the other so the blocks keep their order. The
+        responses are not kept in result, so that concurrent appends do not mix.
+
+        :param block_id: Identifier for a Notion block or page
+        :param children: Children or list of block objects
+        :param after: Identifier of the existing child to append after, appended
+            at the end if not given
+        :return: ids of the created blocks, in order
+        """
+        ids = []
+        for blocks in self._batches(children):
+            result = await self.request.call_api_patch(
+                self._children_url(block_id),
+                self._append_body(blocks, after),
+                idempotent=False,
+            )
+            after = self._created_ids(result, ids, after)
+        return ids
+
+    async def append_children_many(self, appends, max_workers=DEFAULT_APPEND_WORKERS):
+        """
+        Append blocks to several blocks or pages, the parents are appended to
+        concurrently
+
+        :param appends: dict of block id to Children or list of block objects
+        :param max_workers: maximum number of parents appended to at once
+        :return: dict of block id to the ids of its created blocks
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def append(block_id, children):
+            async with semaphore:
+                return await self.append_children(block_id, children)
+
+        ids = await asyncio.gather(
+            *[append(block_id, children) for block_id, children in appends.items()]
+        )
+        return dict(zip(appends, ids))
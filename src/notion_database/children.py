@@ -1,3 +1,74 @@
+import json
+from collections.abc import Mapping
+
+from src.notion_database.properties import rich_text, rich_text_json
+
+
+class TextBlock(Mapping):
+    """
+    Compact block holding rich text
+
+    Blocks are kept as their type, text and extra fields and serialized straight
+    to JSON by to_json, the nested dict of the Notion API is only built by
+    to_dict when needed.
+
+    Reading a block like the dict Children.result used to hold still works
+    (block["type"], dict(block), block == {...}), but it is read only, not a dict
+    instance, and json.dumps needs default=lambda block: block.to_dict().
+    """
+
+    __slots__ = ("type", "text", "extra")
+
+    def __init__(self, type, text, extra=None):
+        """
+        init
+
+        :param type: Notion block type, e.g. "paragraph"
+        :param text: plain text of the block
+        :param extra: other fields of the block type, e.g. {"language": "python"}
+        """
+        self.type = type
+        self.text = text
+        self.extra = extra
+
+    def to_dict(self):
+        """
+        Notion block object
+
+        :return:
+        """
+        content = {"rich_text": rich_text(self.text)}
+        if self.extra:
+            content.update(self.extra)
+        return {"object": "block", "type": self.type, self.type: content}
+
+    def to_json(self):
+        """
+        JSON of the Notion block object, same as json.dumps(self.to_dict())
+
+        :return:
+        """
+        extra = ""
+        if self.extra:
+            extra = ", " + json.dumps(self.extra)[1:-1]
+        return (
+            f'{{"object": "block", "type": "{self.type}", "{self.type}": '
+            f'{{"rich_text": {rich_text_json(self.text)}{extra}}}}}'
+        )
+
+    def __getitem__(self, key):
+        return self.to_dict()[key]
+
+    def __iter__(self):
+        return iter(("object", "type", self.type))
+
+    def __len__(self):
+        return 3
+
+    def __repr__(self):
+        return f"TextBlock({self.type!r}, {self.text!r}, {self.extra!r})"
+
+
 class Children:
     def __init__(self):
         """
@@ -15,20 +86,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "paragraph",
-            "paragraph": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("paragraph", text))
 
     def set_heading_1(self, text=None):
         """
@@ -40,20 +98,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "heading_1",
-            "heading_1": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("heading_1", text))
 
     def set_heading_2(self, text=None):
         """
@@ -65,20 +110,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "heading_2",
-            "heading_2": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("heading_2", text))
 
     def set_heading_3(self, text=None):
         """
@@ -90,20 +122,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "heading_3",
-            "heading_3": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("heading_3", text))
 
     def set_callout(self, text=None):
         """
@@ -115,20 +134,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "callout",
-            "callout": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("callout", text))
 
     def set_quote(self, text=None):
         """
@@ -140,20 +146,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "quote",
-            "quote": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("quote", text))
 
     def set_bulleted_list_item(self, text=None):
         """
@@ -165,20 +158,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "bulleted_list_item",
-            "bulleted_list_item": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("bulleted_list_item", text))
 
     def set_numbered_list_item(self, text=None):
         """
@@ -190,20 +170,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "numbered_list_item",
-            "numbered_list_item": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ]
-            }
-        })
+        self.result.append(TextBlock("numbered_list_item", text))
 
     def set_to_do(self, text=None, checked=False):
         """
@@ -216,21 +183,7 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "to_do",
-            "to_do": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ],
-                "checked": checked,
-            }
-        })
+        self.result.append(TextBlock("to_do", text, {"checked": checked}))
 
     def set_toggle(self, text=None, children_text=""):
         """
@@ -243,34 +196,13 @@ class Children:
         if not text:
             text = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "toggle",
-            "toggle": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": text
-                        }
-                    }
-                ],
-                "children": [{
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [
-                            {
-                                "type": "text",
-                                "text": {
-                                    "content": children_text
-                                }
-                            }
-                        ]
-                    }
-                }],
-            }
-        })
+        self.result.append(
+            TextBlock(
+                "toggle",
+                text,
+                {"children": [TextBlock("paragraph", children_text).to_dict()]},
+            )
+        )
 
     def set_code(self, code=None, lang="plain text"):
         """
@@ -283,21 +215,7 @@ class Children:
         if not code:
             code = ""
 
-        self.result.append({
-            "object": "block",
-            "type": "code",
-            "code": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": code
-                        }
-                    }
-                ],
-                "language": lang,
-            }
-        })
+        self.result.append(TextBlock("code", code, {"language": lang}))
 
     def set_embed(self, url=None):
         """
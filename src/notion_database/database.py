@@ -1,18 +1,36 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from src.notion_database.properties import Properties
-from src.notion_database.request import Request
+from src.notion_database.request import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_TIMEOUT,
+    AsyncRequest,
+    Request,
+    get_base_url,
+)
 
 
 class Database:
-    def __init__(self, integrations_token):
+    def __init__(
+        self, integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+    ):
         """
         init
 
         :param integrations_token: Notion Internal Integration Token
+        :param timeout: requests timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared session
         """
         self.properties_list = []
-        self.url = "https://api.notion.com/v1/databases"
+        self.url = get_base_url() + "/databases"
         self.result = {}
-        self.request = Request(self.url, integrations_token=integrations_token)
+        self.request = Request(
+            self.url,
+            integrations_token=integrations_token,
+            timeout=timeout,
+            pool_size=pool_size,
+        )
 
     def retrieve_database(self, database_id, get_properties=False):
         """
@@ -24,12 +42,8 @@ class Database:
         """
         self.result = self.request.call_api_get(self.url + "/" + database_id)
         if get_properties:
-            self.properties_list.clear()
-            for property_value in self.result["properties"].values():
-                if property_value["id"] == "title":
-                    # property type of the title cannot be changed.
-                    continue
-                self.properties_list.append(property_value)
+            self._check_result(self.result)
+            self._set_properties_list()
 
     def query_database(self):
         # Not Implemented
@@ -45,7 +59,7 @@ class Database:
         if body is None:
             body = {}
         self.result = self.request.call_api_post(
-            self.url + "/" + database_id + "/query", body
+            self.url + "/" + database_id + "/query", body, idempotent=True
         )
 
     def find_all_page(self, database_id, page_size=100, start_cursor: str = None):
@@ -55,14 +69,61 @@ class Database:
         :param page_size: The number of items from the full list desired in the response.
         :param start_cursor: returns a page of results starting after the cursor provided.
         """
-        if start_cursor:
-            body = {"sorts": [], "start_cursor": start_cursor, "page_size": page_size}
-        else:
-            body = {"sorts": [], "page_size": page_size}
+        body = self._find_all_page_body(page_size, start_cursor)
         self.result = self.request.call_api_post(
-            self.url + "/" + database_id + "/query", body
+            self.url + "/" + database_id + "/query", body, idempotent=True
         )
 
+    def iter_pages(
+        self, database_id, filter=None, sorts=None, page_size=100, prefetch=False
+    ):
+        """
+        Iterate over every page of a database, following next_cursor lazily
+
+        Only one batch of results is held at a time (two with prefetch).
+
+        :param database_id: Identifier for a Notion database
+        :param filter: Notion filter object
+        :param sorts: Notion sort objects
+        :param page_size: The number of items requested per query.
+        :param prefetch: query the next batch while the current one is consumed
+        :return: generator of Notion page objects
+        """
+        url = self.url + "/" + database_id + "/query"
+
+        def query(start_cursor):
+            result = self.request.call_api_post(
+                url,
+                self._query_body(filter, sorts, page_size, start_cursor),
+                idempotent=True,
+            )
+            self._check_result(result)
+            return result
+
+        if not prefetch:
+            result = query(None)
+            while True:
+                yield from result["results"]
+                if not result.get("has_more"):
+                    return
+                result = query(result["next_cursor"])
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            result = query(None)
+            while True:
+                future = None
+                if result.get("has_more"):
+                    future = executor.submit(query, result["next_cursor"])
+                try:
+                    yield from result["results"]
+                except GeneratorExit:
+                    if future is not None:
+                        future.cancel()
+                    raise
+                if future is None:
+                    return
+                result = future.result()
+
     def list_databases(self, page_size=100):
         """
         List databases ('This API is deprecated.')
@@ -82,14 +143,7 @@ class Database:
         :param properties: Property schema of database
         :return:
         """
-        if properties is None:
-            properties = Properties()
-        properties = properties
-        body = {
-            "parent": {"type": "page_id", "page_id": page_id},
-            "title": [{"type": "text", "text": {"content": title, "link": None}}],
-            "properties": properties.result,
-        }
+        body = self._create_database_body(page_id, title, properties)
         self.result = self.request.call_api_post(self.url, body)
 
     def update_database(
@@ -99,6 +153,96 @@ class Database:
         Update database
 
         :param database_id: Identifier for a Notion database
+        :param title: Title of database as it appears in Notion
+        :param remove_properties: Removal Property schema of database
+        :param add_properties: Property schema of database
+        :return:
+        """
+        for body in self._update_database_bodies(
+            title, remove_properties, add_properties
+        ):
+            self.result = self.request.call_api_patch(
+                self.url + "/" + database_id, body
+            )
+
+    def _set_properties_list(self):
+        """
+        Fill properties_list from a retrieved database
+
+        :return:
+        """
+        self.properties_list.clear()
+        for property_value in self.result["properties"].values():
+            if property_value["id"] == "title":
+                # property type of the title cannot be changed.
+                continue
+            self.properties_list.append(property_value)
+
+    @staticmethod
+    def _check_result(result):
+        """
+        Raise on a Notion error object
+
+        :param result: decoded Notion response
+        :return:
+        """
+        if result.get("object") == "error":
+            raise ValueError(result.get("code"))
+
+    @staticmethod
+    def _query_body(filter=None, sorts=None, page_size=100, start_cursor=None):
+        """
+        Build the body of a database query
+
+        :param filter: Notion filter object
+        :param sorts: Notion sort objects
+        :param page_size: The number of items from the full list desired in the response.
+        :param start_cursor: returns a page of results starting after the cursor provided.
+        :return:
+        """
+        body = {"sorts": sorts or [], "page_size": page_size}
+        if filter:
+            body["filter"] = filter
+        if start_cursor:
+            body["start_cursor"] = start_cursor
+        return body
+
+    @staticmethod
+    def _find_all_page_body(page_size=100, start_cursor=None):
+        """
+        Build the body of a database query returning every page
+
+        :param page_size: The number of items from the full list desired in the response.
+        :param start_cursor: returns a page of results starting after the cursor provided.
+        :return:
+        """
+        if start_cursor:
+            return {"sorts": [], "start_cursor": start_cursor, "page_size": page_size}
+        return {"sorts": [], "page_size": page_size}
+
+    @staticmethod
+    def _create_database_body(page_id, title, properties=None):
+        """
+        Build the body of a create database request
+
+        :param page_id: Notion Page ID
+        :param title: Title of database as it appears in Notion
+        :param properties: Property schema of database
+        :return:
+        """
+        if properties is None:
+            properties = Properties()
+        return {
+            "parent": {"type": "page_id", "page_id": page_id},
+            "title": [{"type": "text", "text": {"content": title, "link": None}}],
+            "properties": properties.result,
+        }
+
+    @staticmethod
+    def _update_database_bodies(title=None, remove_properties=None, add_properties=None):
+        """
+        Build the bodies of the update database requests, removals are sent first
+
         :param title: Title of database as it appears in Notion
         :param remove_properties: Removal Property schema of database
         :param add_properties: Property schema of database
@@ -106,18 +250,154 @@ class Database:
         """
         if add_properties is None:
             add_properties = Properties()
-        body = {"properties": {}}
+        bodies = []
+        title_body = {}
         if title:
-            body["title"] = [{"type": "text", "text": {"content": title, "link": None}}]
+            title_body["title"] = [
+                {"type": "text", "text": {"content": title, "link": None}}
+            ]
         if remove_properties:
-            body["properties"].update({i["id"]: None for i in remove_properties})
-            self.result = self.request.call_api_patch(
-                self.url + "/" + database_id, body
-            )
-            body["properties"] = {}
+            body = dict(title_body)
+            body["properties"] = {i["id"]: None for i in remove_properties}
+            bodies.append(body)
         if add_properties:
-            body["properties"].update(add_properties.result)
-            self.result = self.request.call_api_patch(
+            body = dict(title_body)
+            body["properties"] = dict(add_properties.result)
+            bodies.append(body)
+        return bodies
+
+
+class AsyncDatabase(Database):
+    def __init__(
+        self, integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+    ):
+        """
+        init
+
+        :param integrations_token: Notion Internal Integration Token
+        :param timeout: httpx timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared client
+        """
+        self.properties_list = []
+        self.url = get_base_url() + "/databases"
+        self.result = {}
+        self.request = AsyncRequest(
+            self.url,
+            integrations_token=integrations_token,
+            timeout=timeout,
+            pool_size=pool_size,
+        )
+
+    async def retrieve_database(self, database_id, get_properties=False):
+        """
+        Retrieve a database
+
+        :param database_id: Identifier for a Notion database
+        :param get_properties: Get properties_list trigger
+        :return:
+        """
+        self.result = await self.request.call_api_get(self.url + "/" + database_id)
+        if get_properties:
+            self._check_result(self.result)
+            self._set_properties_list()
+
+    async def run_query_database(self, database_id, body=None):
+        """
+        for developer
+        :param database_id:
+        :param body:
+        :return:
+        """
+        if body is None:
+            body = {}
+        self.result = await self.request.call_api_post(
+            self.url + "/" + database_id + "/query", body, idempotent=True
+        )
+
+    async def find_all_page(self, database_id, page_size=100, start_cursor: str = None):
+        """
+        find all database page
+        :param database_id: Identifier for a Notion database
+        :param page_size: The number of items from the full list desired in the response.
+        :param start_cursor: returns a page of results starting after the cursor provided.
+        """
+        body = self._find_all_page_body(page_size, start_cursor)
+        self.result = await self.request.call_api_post(
+            self.url + "/" + database_id + "/query", body, idempotent=True
+        )
+
+    async def iter_pages(
+        self, database_id, filter=None, sorts=None, page_size=100, prefetch=False
+    ):
+        """
+        Iterate over every page of a database, following next_cursor lazily
+
+        Only one batch of results is held at a time (two with prefetch).
+
+        :param database_id: Identifier for a Notion database
+        :param filter: Notion filter object
+        :param sorts: Notion sort objects
+        :param page_size: The number of items requested per query.
+        :param prefetch: query the next batch while the current one is consumed
+        :return: async generator of Notion page objects
+        """
+        url = self.url + "/" + database_id + "/query"
+
+        async def query(start_cursor):
+            result = await self.request.call_api_post(
+                url,
+                self._query_body(filter, sorts, page_size, start_cursor),
+                idempotent=True,
+            )
+            self._check_result(result)
+            return result
+
+        result = await query(None)
+        while True:
+            task = None
+            if prefetch and result.get("has_more"):
+                task = asyncio.ensure_future(query(result["next_cursor"]))
+            try:
+                for page in result["results"]:
+                    yield page
+            except GeneratorExit:
+                if task is not None:
+                    task.cancel()
+                raise
+            if not result.get("has_more"):
+                return
+            if task is not None:
+                result = await task
+            else:
+                result = await query(result["next_cursor"])
+
+    async def create_database(self, page_id, title, properties=None):
+        """
+        Create a database
+
+        :param page_id: Notion Page ID
+        :param title: Title of database as it appears in Notion
+        :param properties: Property schema of database
+        :return:
+        """
+        body = self._create_database_body(page_id, title, properties)
+        self.result = await self.request.call_api_post(self.url, body)
+
+    async def update_database(
+        self, database_id, title=None, remove_properties=None, add_properties=None
+    ):
+        """
+        Update database
+
+        :param database_id: Identifier for a Notion database
+        :param title: Title of database as it appears in Notion
+        :param remove_properties: Removal Property schema of database
+        :param add_properties: Property schema of database
+        :return:
+        """
+        for body in self._update_database_bodies(
+            title, remove_properties, add_properties
+        ):
+            self.result = await self.request.call_api_patch(
                 self.url + "/" + database_id, body
             )
-            body["properties"] = {}
@@ -1,22 +1,39 @@
 import logging
 
+from src.notion_database.block import MAX_CHILDREN, AsyncBlock, Block
 from src.notion_database.children import Children
 from src.notion_database.properties import Properties
-from src.notion_database.request import Request
+from src.notion_database.request import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_TIMEOUT,
+    AsyncRequest,
+    Request,
+    get_base_url,
+)
 
 LOGGER = logging.getLogger("Notion-Database")
 
 
 class Page:
-    def __init__(self, integrations_token):
+    def __init__(
+        self, integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+    ):
         """
         init
 
         :param integrations_token: Notion Internal Integration Token
+        :param timeout: requests timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared session
         """
-        self.url = "https://api.notion.com/v1/pages"
+        self.url = get_base_url() + "/pages"
         self.result = {}
-        self.request = Request(self.url, integrations_token=integrations_token)
+        self.request = Request(
+            self.url,
+            integrations_token=integrations_token,
+            timeout=timeout,
+            pool_size=pool_size,
+        )
+        self.block = Block(integrations_token, timeout=timeout, pool_size=pool_size)
 
     def retrieve_page(self, page_id):
         """
@@ -33,23 +50,37 @@ class Page:
 
         :param database_id: Identifier for a Notion database
         :param properties: Property values of this page
-        :param children: Page content for the new page
+        :param children: Page content for the new page, blocks past MAX_CHILDREN
+            are appended afterwards. If that fails the page is archived, so
+            that creating it again leaves no partial copy, and result holds it.
         :return:
         """
-        if children is None:
-            children = Children()
-        if properties is None:
-            properties = Properties()
-        properties = properties
-        children = children
-        body = {
-            "parent": {"database_id": database_id},
-            "properties": properties.result,
-            "children": children.result,
-        }
+        body = self._create_page_body(database_id, properties, children)
         self.result = self.request.call_api_post(self.url, body)
 
         self.check_field()
+        if children is not None and len(children.result) > MAX_CHILDREN:
+            page_id = self.result["id"]
+            try:
+                self.append_children(page_id, children.result[MAX_CHILDREN:])
+            except Exception:
+                # a retried create must not leave a partial duplicate behind
+                LOGGER.error(f"Archiving page {page_id}, its children were not added")
+                try:
+                    self.archive_page(page_id, True)
+                except Exception as e:
+                    LOGGER.error(f"Could not archive page {page_id}: {e!r}")
+                raise
+
+    def append_children(self, block_id, blocks):
+        """
+        Append blocks to a page or block, MAX_CHILDREN blocks per request
+
+        :param block_id: Identifier for a Notion page or block
+        :param blocks: Children or list of block objects
+        :return: ids of the created blocks
+        """
+        return self.block.append_children(block_id, blocks)
 
     def update_page(self, page_id, properties=None):
         """
@@ -59,11 +90,7 @@ class Page:
         :param properties: Property values to update for this page
         :return:
         """
-        if properties is None:
-            properties = Properties()
-        body = {
-            "properties": properties.result,
-        }
+        body = self._update_page_body(properties)
         self.result = self.request.call_api_patch(self.url + "/" + page_id, body)
 
         self.check_field()
@@ -83,12 +110,160 @@ class Page:
 
         self.check_field()
 
+    @staticmethod
+    def _create_page_body(database_id, properties=None, children=None):
+        """
+        Build the body of a create page request
+
+        :param database_id: Identifier for a Notion database
+        :param properties: Property values of this page
+        :param children: Page content for the new page
+        :return:
+        """
+        if children is None:
+            children = Children()
+        if properties is None:
+            properties = Properties()
+        # the rest is appended once the page exists
+        return {
+            "parent": {"database_id": database_id},
+            "properties": properties.result,
+            "children": children.result[:MAX_CHILDREN],
+        }
+
+    @staticmethod
+    def _update_page_body(properties=None):
+        """
+        Build the body of an update page request
+
+        :param properties: Property values to update for this page
+        :return:
+        """
+        if properties is None:
+            properties = Properties()
+        return {
+            "properties": properties.result,
+        }
+
     def check_field(self):
         """
         Check the Object Error
 
         :return:
         """
-        if self.result["object"] == "error":
-            LOGGER.error(self.result["message"])
-            raise ValueError(self.result["code"])
+        self._check_error(self.result)
+
+    @staticmethod
+    def _check_error(result):
+        """
+        Raise on a Notion error object
+
+        :param result: decoded Notion response
+        :return:
+        """
+        if result["object"] == "error":
+            LOGGER.error(result["message"])
+            raise ValueError(result["code"])
+
+
+class AsyncPage(Page):
+    def __init__(
+        self, integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+    ):
+        """
+        init
+
+        :param integrations_token: Notion Internal Integration Token
+        :param timeout: httpx timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared client
+        """
+        self.url = get_base_url() + "/pages"
+        self.result = {}
+        self.request = AsyncRequest(
+            self.url,
+            integrations_token=integrations_token,
+            timeout=timeout,
+            pool_size=pool_size,
+        )
+        self.block = AsyncBlock(
+            integrations_token, timeout=timeout, pool_size=pool_size
+        )
+
+    async def retrieve_page(self, page_id):
+        """
+        Retrieve a page
+
+        :param page_id: Identifier for a Notion page
+        :return:
+        """
+        self.result = await self.request.call_api_get(self.url + "/" + page_id)
+
+    async def create_page(self, database_id, properties=None, children=None):
+        """
+        Create a page
+
+        :param database_id: Identifier for a Notion database
+        :param properties: Property values of this page
+        :param children: Page content for the new page, blocks past MAX_CHILDREN
+            are appended afterwards. If that fails the page is archived, so
+            that creating it again leaves no partial copy, and result holds it.
+        :return:
+        """
+        body = self._create_page_body(database_id, properties, children)
+        self.result = await self.request.call_api_post(self.url, body)
+
+        self.check_field()
+        if children is not None and len(children.result) > MAX_CHILDREN:
+            page_id = self.result["id"]
+            try:
+                await self.append_children(page_id, children.result[MAX_CHILDREN:])
+            except Exception:
+                # a retried create must not leave a partial duplicate behind
+                LOGGER.error(f"Archiving page {page_id}, its children were not added")
+                try:
+                    await self.archive_page(page_id, True)
+                except Exception as e:
+                    LOGGER.error(f"Could not archive page {page_id}: {e!r}")
+                raise
+
+    async def append_children(self, block_id, blocks):
+        """
+        Append blocks to a page or block, MAX_CHILDREN blocks per request
+
+        :param block_id: Identifier for a Notion page or block
+        :param blocks: Children or list of block objects
+        :return: ids of the created blocks
+        """
+        return await self.block.append_children(block_id, blocks)
+
+    async def update_page(self, page_id, properties=None):
+        """
+        Update page
+
+        :param page_id: Identifier for a Notion page
+        :param properties: Property values to update for this page
+        :return:
+        """
+        body = self._update_page_body(properties)
+        self.result = await self.request.call_api_patch(
+            self.url + "/" + page_id, body
+        )
+
+        self.check_field()
+
+    async def archive_page(self, page_id, archived):
+        """
+        Archive page
+
+        :param page_id: Identifier for a Notion page
+        :param archived: Set to archive a page.
+        :return:
+        """
+        body = {
+            "archived": archived,
+        }
+        self.result = await self.request.call_api_patch(
+            self.url + "/" + page_id, body
+        )
+
+        self.check_field()
@@ -1,4 +1,57 @@
 # support : "title", "rich_text", "number", "select", "multi_select", "checkbox", "url", "email", "phone_number"
+import json
+import logging
+
+LOGGER = logging.getLogger("Notion-Database")
+
+# https://developers.notion.com/reference/request-limits
+RICH_TEXT_MAX_LENGTH = 2000
+RICH_TEXT_MAX_SEGMENTS = 100
+
+
+def rich_text(text):
+    """
+    Rich text objects of a plain text, split in segments Notion accepts
+
+    Notion limits the content of a text object to 2000 characters, longer texts
+    are sent as consecutive segments which render as one text.
+
+    :param text: plain text
+    :return: list of rich text objects
+    """
+    size = RICH_TEXT_MAX_LENGTH
+    segments = [
+        {"type": "text", "text": {"content": text[start : start + size]}}
+        for start in range(0, max(len(text), 1), size)
+    ]
+    if len(segments) > RICH_TEXT_MAX_SEGMENTS:
+        LOGGER.warning(
+            f"Text of {len(text)} characters truncated to "
+            f"{RICH_TEXT_MAX_SEGMENTS * RICH_TEXT_MAX_LENGTH}"
+        )
+        del segments[RICH_TEXT_MAX_SEGMENTS:]
+    return segments
+
+
+def rich_text_json(text):
+    """
+    JSON of rich_text(text), written without building the objects
+
+    :param text: plain text
+    :return: str
+    """
+    size = RICH_TEXT_MAX_LENGTH
+    if len(text) > size * RICH_TEXT_MAX_SEGMENTS:
+        return json.dumps(rich_text(text))
+    return (
+        "["
+        + ", ".join(
+            '{"type": "text", "text": {"content": %s}}'
+            % json.dumps(text[start : start + size])
+            for start in range(0, max(len(text), 1), size)
+        )
+        + "]"
+    )
 
 
 class Properties:
@@ -17,7 +70,7 @@ class Properties:
         :return:
         """
         if text:
-            text = [{"text": {"content": text}}]
+            text = rich_text(text)
         else:
             text = {}
         self.result.update({col: {"title": text}})
@@ -31,7 +84,7 @@ class Properties:
         :return:
         """
         if text:
-            text = [{"text": {"content": text}}]
+            text = rich_text(text)
         else:
             text = {}
         self.result.update({col: {"rich_text": text}})
@@ -44,10 +97,12 @@ class Properties:
         :param text: page text. If no text is given, for database only.
         :return:
         """
-        if text:
-            text = int(text)
-        else:
+        if text is None or text == "":
             text = {}
+        else:
+            # 0 and fractions are kept, whole numbers are sent as integers
+            number = float(text)
+            text = int(number) if number.is_integer() else number
         self.result.update({col: {"number": text}})
 
     def set_select(self, col, text=None):
@@ -89,7 +144,7 @@ class Properties:
         :param text: page text. If no text is given, for database only.
         :return:
         """
-        if not text:
+        if text is None:
             text = {}
         self.result.update({col: {"checkbox": text}})
 
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+
+# Notion allows an average of three requests per second per integration
+DEFAULT_RATE = 3.0
+DEFAULT_BURST = 3
+DEFAULT_MAX_RETRIES = 5
+RETRY_STATUSES = (500, 502, 503, 504)
+# a request that is not idempotent may have been carried out before the others
+UNSAFE_RETRY_STATUSES = (503,)
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+class RateLimiter:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        """
+        Token bucket shared by every request of an integration
+
+        :param rate: tokens (requests) added per second
+        :param burst: bucket size, requests that may be sent back to back
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        # tokens refill from this time on, it lies in the future while paused
+        self._updated = time.monotonic()
+        # bumped by pause(), reservations taken before a pause are void
+        self._epoch = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        """
+        Number of requests currently waiting for a token
+
+        :return:
+        """
+        return self._waiting
+
+    def _reserve(self):
+        """
+        Take a token, the bucket goes into debt when empty
+
+        :return: seconds to wait before sending and the reservation epoch
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+            self._tokens -= 1
+            wait = self._updated - now
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+            return wait, self._epoch
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+
+        :return:
+        """
+        wait, epoch = self._reserve()
+        if wait <= 0:
+            return
+        self._waiting += 1
+        try:
+            while wait > 0:
+                time.sleep(wait)
+                wait = 0.0
+                if epoch != self._epoch:
+                    wait, epoch = self._reserve()
+        finally:
+            self._waiting -= 1
+
+    async def acquire_async(self):
+        """
+        Wait without blocking the event loop until a request may be sent
+
+        :return:
+        """
+        wait, epoch = self._reserve()
+        if wait <= 0:
+            return
+        self._waiting += 1
+        try:
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = 0.0
+                if epoch != self._epoch:
+                    wait, epoch = self._reserve()
+        finally:
+            self._waiting -= 1
+
+    def set_rate(self, rate):
+        """
+        Change the rate, e.g. when the settings are reloaded
+
+        :param rate: tokens (requests) added per second
+        :return:
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                # tokens earned so far are kept, at the old rate
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+            self.rate = rate
+
+    def pause(self, delay):
+        """
+        Stop handing out tokens for delay seconds, e.g. after a 429
+
+        :param delay: seconds to pause
+        :return:
+        """
+        with self._lock:
+            self._updated = max(self._updated, time.monotonic() + delay)
+            # a single request goes through when the pause ends
+            self._tokens = 1.0
+            self._epoch += 1
+
+
+def get_rate_limiter(integrations_token, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+    """
+    Get the rate limiter shared by every client of an integration
+
+    The first call for a token decides its rate and burst.
+
+    :param integrations_token: Notion Internal Integration Token
+    :param rate: requests per second
+    :param burst: requests that may be sent back to back
+    :return:
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(integrations_token)
+        if limiter is None:
+            limiter = RateLimiter(rate=rate, burst=burst)
+            _LIMITERS[integrations_token] = limiter
+    return limiter
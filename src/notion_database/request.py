@@ -1,17 +1,227 @@
+import asyncio
 import json
+import logging
+import os
+import threading
+import time
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+
+from src.notion_database.rate_limit import (
+    DEFAULT_MAX_RETRIES,
+    RETRY_STATUSES,
+    UNSAFE_RETRY_STATUSES,
+    get_rate_limiter,
+)
+from src.utils.retry_utils import backoff_delay, retry_after_delay
 
 NOTION_VERSION = "2022-06-28"
+DEFAULT_BASE_URL = "https://api.notion.com/v1"
+DEFAULT_POOL_SIZE = 10
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+
+LOGGER = logging.getLogger("Notion-Database")
+
+_SESSIONS = {}
+_ASYNC_CLIENTS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_base_url():
+    """
+    Base URL of the Notion API, NOTION_BASE_URL points the clients created
+    afterwards to a stand-in (e.g. tools/fake_notion.py)
+
+    :return:
+    """
+    return os.getenv("NOTION_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+
+def get_session(integrations_token, pool_size=DEFAULT_POOL_SIZE):
+    """
+    Get the keep-alive session shared by every client of an integration
+
+    The session is created on first use, later calls with the same token reuse it
+    (and its pool size) so TCP+TLS connections to the Notion API are kept warm.
+
+    :param integrations_token: Notion Internal Integration Token
+    :param pool_size: maximum number of pooled connections to the Notion API
+    :return:
+    """
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(integrations_token)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {
+                    "Authorization": f"Bearer {integrations_token}",
+                    "Content-Type": "application/json",
+                    "Notion-Version": NOTION_VERSION,
+                }
+            )
+            _SESSIONS[integrations_token] = session
+    return session
+
+
+def httpx_timeout(timeout):
+    """
+    httpx timeout of a requests style timeout
+
+    :param timeout: seconds or a (connect, read) tuple
+    :return:
+    """
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return timeout
+
+
+def get_async_client(
+    integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+):
+    """
+    Get the async HTTP client shared by every async client of an integration
+
+    :param integrations_token: Notion Internal Integration Token
+    :param timeout: default timeout, seconds or a (connect, read) tuple
+    :param pool_size: maximum number of pooled connections to the Notion API
+    :return:
+    """
+    with _SESSIONS_LOCK:
+        client = _ASYNC_CLIENTS.get(integrations_token)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers={
+                    "Authorization": f"Bearer {integrations_token}",
+                    "Content-Type": "application/json",
+                    "Notion-Version": NOTION_VERSION,
+                },
+                timeout=httpx_timeout(timeout),
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+            )
+            _ASYNC_CLIENTS[integrations_token] = client
+    return client
+
+
+async def aclose_async_clients():
+    """
+    Close every shared async client
+
+    :return:
+    """
+    with _SESSIONS_LOCK:
+        clients = list(_ASYNC_CLIENTS.values())
+        _ASYNC_CLIENTS.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def close_sessions():
+    """
+    Close every shared session
+
+    :return:
+    """
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+def parse_response(status_code, text):
+    """
+    Decode a Notion response, non JSON bodies become a Notion error object
+
+    :param status_code: HTTP status code
+    :param text: response body
+    :return:
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {
+            "object": "error",
+            "status": status_code,
+            "code": "invalid_response",
+            "message": text[:200],
+        }
+
+
+def retry_statuses(idempotent):
+    """
+    Statuses a request is retried on, besides 429
+
+    :param idempotent: whether sending the request twice is harmless
+    :return:
+    """
+    return RETRY_STATUSES if idempotent else UNSAFE_RETRY_STATUSES
+
+
+def _to_dict(value):
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_value(value):
+    if isinstance(value, list) and any(hasattr(item, "to_json") for item in value):
+        return (
+            "["
+            + ", ".join(
+                item.to_json() if hasattr(item, "to_json") else json.dumps(item)
+                for item in value
+            )
+            + "]"
+        )
+    return json.dumps(value, default=_to_dict)
+
+
+def encode_body(body):
+    """
+    Encode a request body to JSON bytes
+
+    Lists of compact blocks (e.g. Children().result) are written from the JSON of
+    every block, in one pass and without building their dicts first.
+
+    :param body: request body
+    :return: bytes
+    """
+    if not isinstance(body, dict):
+        return json.dumps(body, default=_to_dict).encode()
+    return (
+        "{"
+        + ", ".join(
+            f"{json.dumps(key)}: {_encode_value(value)}" for key, value in body.items()
+        )
+        + "}"
+    ).encode()
 
 
 class Request:
-    def __init__(self, url, integrations_token):
+    def __init__(
+        self,
+        url,
+        integrations_token,
+        timeout=DEFAULT_TIMEOUT,
+        pool_size=DEFAULT_POOL_SIZE,
+        max_retries=DEFAULT_MAX_RETRIES,
+    ):
         """
         init
 
         :param url: Notion API URL
         :param integrations_token: Notion Internal Integration Token
+        :param timeout: requests timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared session
+        :param max_retries: retries of rate limited, 5xx and failed requests
         """
         self.NOTION_KEY = integrations_token
         self.NOTION_VERSION = NOTION_VERSION
@@ -21,17 +231,79 @@ class Request:
             "Notion-Version": self.NOTION_VERSION,
         }
         self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = get_session(integrations_token, pool_size=pool_size)
+        self.limiter = get_rate_limiter(integrations_token)
 
-    def call_api_post(self, url, body):
+    @property
+    def queue_depth(self):
+        """
+        Number of requests of this integration waiting for the rate limiter
+
+        :return:
+        """
+        return self.limiter.queue_depth
+
+    def call_api(self, method, url, body=None, idempotent=None):
+        """
+        Send a paced request, retrying 429 (after Retry-After), 5xx and
+        connection errors with jittered exponential backoff
+
+        Requests that are not idempotent (e.g. creating a page) may have been
+        carried out when a read timeout or a 502/504 comes back, they are only
+        retried on connect errors, 429 and 503 and the other failures are left
+        to the caller.
+
+        :param method: HTTP method
+        :param url:
+        :param body:
+        :param idempotent: whether sending the request twice is harmless,
+            every method but POST by default
+        :return:
+        """
+        if idempotent is None:
+            idempotent = method != "POST"
+        statuses = retry_statuses(idempotent)
+        data = None if body is None else encode_body(body)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.limiter.acquire()
+            try:
+                r = self.session.request(method, url, data=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # nothing was sent when the connection could not be opened
+                if last_attempt or not (
+                    idempotent or isinstance(e, requests.ConnectTimeout)
+                ):
+                    raise
+                LOGGER.warning(f"{method} {url} failed: {e}, retrying")
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            if r.status_code == 429 and not last_attempt:
+                delay = retry_after_delay(r.headers)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                LOGGER.warning(f"Rate limited by Notion, pausing {delay:.1f}s")
+                self.limiter.pause(delay)
+                continue
+            if r.status_code in statuses and not last_attempt:
+                LOGGER.warning(f"{method} {url} returned {r.status_code}, retrying")
+                time.sleep(backoff_delay(attempt))
+                continue
+            return parse_response(r.status_code, r.text)
+
+    def call_api_post(self, url, body, idempotent=False):
         """
         request post
 
         :param url:
         :param body:
+        :param idempotent: True for POSTs that only read, e.g. database queries
         :return:
         """
-        r = requests.post(url, data=json.dumps(body), headers=self.HEADER).json()
-        return r
+        return self.call_api("POST", url, body, idempotent=idempotent)
 
     def call_api_get(self, url):
         """
@@ -40,16 +312,137 @@ class Request:
         :param url:
         :return:
         """
-        r = requests.get(url, headers=self.HEADER).json()
-        return r
+        return self.call_api("GET", url)
+
+    def call_api_patch(self, url, body, idempotent=True):
+        """
+        request patch
+
+        :param url:
+        :param body:
+        :param idempotent: False for PATCHes that add content, e.g. appending
+            block children
+        :return:
+        """
+        return self.call_api("PATCH", url, body, idempotent=idempotent)
+
+
+class AsyncRequest:
+    def __init__(
+        self,
+        url,
+        integrations_token,
+        timeout=DEFAULT_TIMEOUT,
+        pool_size=DEFAULT_POOL_SIZE,
+        max_retries=DEFAULT_MAX_RETRIES,
+    ):
+        """
+        init
+
+        :param url: Notion API URL
+        :param integrations_token: Notion Internal Integration Token
+        :param timeout: httpx timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared client
+        :param max_retries: retries of rate limited, 5xx and failed requests
+        """
+        self.NOTION_KEY = integrations_token
+        self.NOTION_VERSION = NOTION_VERSION
+        self.url = url
+        self.max_retries = max_retries
+        # per request, the shared client keeps the timeout it was created with
+        self.timeout = httpx_timeout(timeout)
+        self.client = get_async_client(
+            integrations_token, timeout=timeout, pool_size=pool_size
+        )
+        self.limiter = get_rate_limiter(integrations_token)
+
+    @property
+    def queue_depth(self):
+        """
+        Number of requests of this integration waiting for the rate limiter
+
+        :return:
+        """
+        return self.limiter.queue_depth
+
+    async def call_api(self, method, url, body=None, idempotent=None):
+        """
+        Send a paced request, retrying 429 (after Retry-After), 5xx and
+        connection errors with jittered exponential backoff
+
+        Requests that are not idempotent are only retried on connect errors, 429
+        and 503, see Request.call_api.
+
+        :param method: HTTP method
+        :param url:
+        :param body:
+        :param idempotent: whether sending the request twice is harmless,
+            every method but POST by default
+        :return:
+        """
+        if idempotent is None:
+            idempotent = method != "POST"
+        statuses = retry_statuses(idempotent)
+        content = None if body is None else encode_body(body)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            await self.limiter.acquire_async()
+            try:
+                r = await self.client.request(
+                    method, url, content=content, timeout=self.timeout
+                )
+            except httpx.TransportError as e:
+                # nothing was sent when the connection could not be opened
+                if last_attempt or not (
+                    idempotent
+                    or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                ):
+                    raise
+                LOGGER.warning(f"{method} {url} failed: {e}, retrying")
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if r.status_code == 429 and not last_attempt:
+                delay = retry_after_delay(r.headers)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                LOGGER.warning(f"Rate limited by Notion, pausing {delay:.1f}s")
+                self.limiter.pause(delay)
+                continue
+            if r.status_code in statuses and not last_attempt:
+                LOGGER.warning(f"{method} {url} returned {r.status_code}, retrying")
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            return parse_response(r.status_code, r.text)
+
+    async def call_api_post(self, url, body, idempotent=False):
+        """
+        request post
+
+        :param url:
+        :param body:
+        :param idempotent: True for POSTs that only read, e.g. database queries
+        :return:
+        """
+        return await self.call_api("POST", url, body, idempotent=idempotent)
+
+    async def call_api_get(self, url):
+        """
+        request get
+
+        :param url:
+        :return:
+        """
+        return await self.call_api("GET", url)
 
-    def call_api_patch(self, url, body):
+    async def call_api_patch(self, url, body, idempotent=True):
         """
         request patch
 
         :param url:
         :param body:
+        :param idempotent: False for PATCHes that add content, e.g. appending
+            block children
         :return:
         """
-        r = requests.patch(url, data=json.dumps(body), headers=self.HEADER).json()
-        return r
+        return await self.call_api("PATCH", url, body, idempotent=idempotent)
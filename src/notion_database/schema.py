@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import threading
+import time
+
+from src.notion_database.database import AsyncDatabase, Database
+from src.notion_database.properties import Properties
+from src.notion_database.request import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+
+LOGGER = logging.getLogger("Notion-Database")
+
+DEFAULT_SCHEMA_TTL = 600
+# https://developers.notion.com/reference/request-limits
+URL_MAX_LENGTH = 2000
+SELECT_OPTION_MAX_LENGTH = 100
+MULTI_SELECT_MAX_OPTIONS = 100
+
+# strings a checkbox is checked for
+CHECKED_VALUES = ("1", "true", "yes", "on")
+
+TEXT_TYPES = ("title", "rich_text")
+STRING_TYPES = ("url", "email", "phone_number")
+# property types Properties can set
+SUPPORTED_TYPES = (
+    *TEXT_TYPES,
+    *STRING_TYPES,
+    "number",
+    "select",
+    "multi_select",
+    "checkbox",
+)
+
+
+class DatabaseSchema:
+    def __init__(self, database_result):
+        """
+        Property schema of a retrieved database
+
+        :param database_result: a Notion database object
+        """
+        self.id = database_result["id"]
+        self.properties = {
+            name: property_value["type"]
+            for name, property_value in database_result["properties"].items()
+        }
+        self.fetched_at = time.monotonic()
+        # identifies the database and its column types, stable across processes
+        digest = hashlib.sha1(
+            "\n".join(
+                f"{name}:{kind}" for name, kind in sorted(self.properties.items())
+            ).encode()
+        ).hexdigest()[:16]
+        self.marker = f"{self.id}:{digest}"
+        # existing option names of the select columns, by lower case name
+        self.options = {
+            name: {
+                option["name"].lower(): option["name"]
+                for option in property_value.get(property_value["type"], {}).get(
+                    "options", []
+                )
+            }
+            for name, property_value in database_result["properties"].items()
+            if property_value["type"] in ("select", "multi_select")
+        }
+        self.title_property = next(
+            name for name, kind in self.properties.items() if kind == "title"
+        )
+        # the Properties setter of every supported column, computed once
+        self.setters = {
+            name: getattr(Properties, f"set_{kind}")
+            for name, kind in self.properties.items()
+            if kind in SUPPORTED_TYPES
+        }
+
+    def type_of(self, col):
+        """
+        Type of a column
+
+        :param col: column name
+        :return: the Notion property type, None for an unknown column
+        """
+        return self.properties.get(col)
+
+    def build(self, values):
+        """
+        Build page properties from raw values, coerced to the column types
+
+        Unknown and read-only columns are skipped with a warning instead of
+        failing the request in Notion.
+
+        :param values: dict of column name to str, list or number
+        :return: Properties
+        """
+        props = Properties()
+        for col, value in values.items():
+            setter = self.setters.get(col)
+            if setter is None:
+                LOGGER.warning(
+                    f"Skipping {col}: not a writable property of database {self.id}"
+                )
+                continue
+            value = self.coerce(self.properties[col], value)
+            setter(props, col, self.match_options(col, value))
+        return props
+
+    def match_options(self, col, value):
+        """
+        Reuse the existing options of a select column, ignoring case, so that
+        Notion does not create near duplicate options
+
+        :param col: column name
+        :param value: coerced value, an option name or a list of them
+        :return: the value with the existing option names
+        """
+        options = self.options.get(col)
+        if not options or value is None:
+            return value
+        names = value if isinstance(value, list) else [value]
+        matched = [options.get(name.lower(), name) for name in names]
+        new = [name for name in matched if name not in options.values()]
+        if new:
+            LOGGER.info(f"New options of {col} will be created: {', '.join(new)}")
+        return matched if isinstance(value, list) else matched[0]
+
+    @staticmethod
+    def coerce(kind, value):
+        """
+        Convert a raw value to what a property type accepts, within Notion limits
+
+        :param kind: Notion property type
+        :param value: str, list or number
+        :return: the value to give to the Properties setter
+        """
+        if value is None or value == "":
+            return None
+        if kind == "multi_select":
+            names = value.split(", ") if isinstance(value, str) else value
+            names = [
+                name.replace(",", " ").strip()[:SELECT_OPTION_MAX_LENGTH]
+                for name in names
+            ]
+            return list(dict.fromkeys(name for name in names if name))[
+                :MULTI_SELECT_MAX_OPTIONS
+            ]
+        if kind == "number":
+            return float(value)
+        if kind == "checkbox":
+            if isinstance(value, str):
+                return value.strip().lower() in CHECKED_VALUES
+            return bool(value)
+
+        if isinstance(value, list):
+            value = ", ".join(map(str, value))
+        value = str(value)
+        if kind == "select":
+            # commas are not allowed in option names
+            return value.replace(",", " ").strip()[:SELECT_OPTION_MAX_LENGTH]
+        if kind == "url":
+            return value[:URL_MAX_LENGTH]
+        # long texts are split in segments by Properties
+        return value
+
+
+class SchemaCache:
+    def __init__(
+        self,
+        integrations_token,
+        timeout=DEFAULT_TIMEOUT,
+        pool_size=DEFAULT_POOL_SIZE,
+        ttl=DEFAULT_SCHEMA_TTL,
+    ):
+        """
+        Database schemas retrieved once and kept for ttl seconds
+
+        :param integrations_token: Notion Internal Integration Token
+        :param timeout: requests timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared session
+        :param ttl: seconds before a schema is retrieved again
+        """
+        self.integrations_token = integrations_token
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.ttl = ttl
+        # database id to (schema, expiry)
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def cached(self, database_id):
+        """
+        Fresh cached schema of a database
+
+        :param database_id: Identifier for a Notion database
+        :return: DatabaseSchema or None
+        """
+        schema, expires_at = self._schemas.get(database_id, (None, 0))
+        if time.monotonic() >= expires_at:
+            return None
+        return schema
+
+    def put(self, database_id, schema, ttl=None):
+        """
+        Cache the schema of a database
+
+        :param database_id: Identifier for a Notion database
+        :param schema: DatabaseSchema
+        :param ttl: seconds the schema is kept, the cache ttl if not given
+        :return:
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._schemas[database_id] = (schema, time.monotonic() + ttl)
+
+    def get(self, database_id):
+        """
+        Schema of a database, retrieved when missing or expired
+
+        :param database_id: Identifier for a Notion database
+        :return: DatabaseSchema
+        """
+        schema = self.cached(database_id)
+        if schema is not None:
+            return schema
+        # one retrieval per database even when many threads miss at once
+        with self._lock:
+            schema = self.cached(database_id)
+            if schema is None:
+                database = Database(
+                    self.integrations_token,
+                    timeout=self.timeout,
+                    pool_size=self.pool_size,
+                )
+                database.retrieve_database(database_id, get_properties=True)
+                schema = DatabaseSchema(database.result)
+                self.put(database_id, schema)
+        return schema
+
+    async def aget(self, database_id):
+        """
+        Schema of a database, retrieved without blocking when missing or expired
+
+        :param database_id: Identifier for a Notion database
+        :return: DatabaseSchema
+        """
+        schema = self.cached(database_id)
+        if schema is not None:
+            return schema
+        database = AsyncDatabase(
+            self.integrations_token, timeout=self.timeout, pool_size=self.pool_size
+        )
+        await database.retrieve_database(database_id, get_properties=True)
+        schema = DatabaseSchema(database.result)
+        self.put(database_id, schema)
+        return schema
+
+    def invalidate(self, database_id=None):
+        """
+        Forget the schema of a database, or every schema
+
+        :param database_id: Identifier for a Notion database
+        :return:
+        """
+        if database_id is None:
+            self._schemas.clear()
+        else:
+            self._schemas.pop(database_id, None)
@@ -2,37 +2,223 @@ import json
 import logging
 import os
 import re
+from contextlib import contextmanager
 from datetime import date
+from typing import Iterable, NamedTuple, Optional, Union
 
-from dotenv import load_dotenv
+from dotenv import dotenv_values, find_dotenv
 
-from src.notion_database.database import Database
-from src.notion_database.page import Page
+from src.notion_database.block import AsyncBlock, Block
+from src.notion_database.children import Children
+from src.notion_database.database import AsyncDatabase, Database
+from src.notion_database.page import AsyncPage, Page
 from src.notion_database.properties import Properties
+from src.notion_database.rate_limit import DEFAULT_RATE, get_rate_limiter
+from src.notion_database.request import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+from src.notion_database.schema import DEFAULT_SCHEMA_TTL, DatabaseSchema, SchemaCache
+from src.write_queue import WriteQueue
+
+NOTION_PAGE_ID_REGEX = re.compile(r"([\w|\d]{32}$)")
+# seconds the expected schema stands in after a failed retrieval
+SCHEMA_FALLBACK_TTL = 60
+
+logger = logging.getLogger(__name__)
+
+# the real environment, imported before the entry points load the .env file
+_PROCESS_ENV = frozenset(os.environ)
+# path of the .env file, resolved once
+_ENV_FILE = None
+
+
+def env_file() -> str:
+    """Path of the .env file of the process
+
+    Looked up from the project directory upwards on the first call, then kept: a
+    reload reads the file loaded at startup whatever the working directory, e.g.
+    under systemd, which starts services in $HOME.
+
+    Returns:
+        str: the path, empty if there is no .env file
+    """
+    global _ENV_FILE
+    if _ENV_FILE is None:
+        # searched from the directory of this file, not the working directory
+        _ENV_FILE = find_dotenv()
+    return _ENV_FILE
+
+
+def load_env_file() -> None:
+    """Load the .env file again, the real environment still wins over it"""
+    path = env_file()
+    if not path:
+        logger.warning("No .env file found, the settings come from the environment")
+        return
+    for key, value in dotenv_values(path).items():
+        if key not in _PROCESS_ENV and value is not None:
+            os.environ[key] = value
+
+
+class NotionSettings(NamedTuple):
+    api_key: str
+    page_url: str
+    database_id: str
+    pool_size: int
+    timeout: Union[float, tuple[float, float]]
+    rate_limit: float
+    schema_ttl: float
+
+    @classmethod
+    def from_env(cls, use_ids: bool = True) -> "NotionSettings":
+        """Read the settings from the environment and the .env file
+
+        Args:
+            use_ids (bool): use the NOTION_*_IDS variables
+        Returns:
+            NotionSettings: the parsed settings
+        """
+        load_env_file()
+        ids_str = "_IDS" if use_ids else ""
+        page_url = os.getenv(f"NOTION_PAGE_URL{ids_str}")
+        return cls(
+            api_key=os.getenv(f"NOTION_API_KEY{ids_str}"),
+            page_url=page_url,
+            database_id=NotionUpdater.get_page_id_from_url(page_url),
+            pool_size=int(os.getenv("NOTION_POOL_SIZE", DEFAULT_POOL_SIZE)),
+            timeout=(
+                float(os.getenv("NOTION_TIMEOUT"))
+                if os.getenv("NOTION_TIMEOUT")
+                else DEFAULT_TIMEOUT
+            ),
+            rate_limit=float(os.getenv("NOTION_RATE_LIMIT", DEFAULT_RATE)),
+            schema_ttl=float(os.getenv("NOTION_SCHEMA_TTL", DEFAULT_SCHEMA_TTL)),
+        )
 
 
 class NotionUpdater:
-    """Update Notion Database with new papers."""
+    """
+    Update Notion Database with new papers.
+
+    Meant to be created once per process and shared: the settings are parsed
+    once and only read again by reload.
+    """
 
     PAGE_TITLE_MAX_LENGTH = 100
+    # expected columns, used as the schema when the database cannot be retrieved
+    COLUMN_TYPES = {
+        "Type": "select",
+        "Name": "title",
+        "Authors": "multi_select",
+        "Link": "url",
+        "Publication Date": "rich_text",
+        "Abstract": "rich_text",
+        "Added By": "rich_text",
+        "Date Added": "rich_text",
+    }
 
-    def __init__(self) -> None:
+    def __init__(self, settings: Optional[NotionSettings] = None) -> None:
         self.use_ids = True
+        self.setup_settings(settings)
+
+    def setup_settings(self, settings: Optional[NotionSettings] = None) -> None:
+        """Setup the settings, from the .env file if none are given"""
+        settings = settings or NotionSettings.from_env(self.use_ids)
+        get_rate_limiter(settings.api_key, rate=settings.rate_limit).set_rate(
+            settings.rate_limit
+        )
+        previous = getattr(self, "settings", None)
+        if previous is not None and previous.pool_size != settings.pool_size:
+            # the pooled session and client of the token are kept
+            logger.warning("NOTION_POOL_SIZE is only applied after a restart")
+        self.schemas = SchemaCache(
+            settings.api_key,
+            timeout=settings.timeout,
+            pool_size=settings.pool_size,
+            ttl=settings.schema_ttl,
+        )
+        self.expected_schema = DatabaseSchema(
+            {
+                "id": settings.database_id,
+                "properties": {
+                    col: {"type": kind} for col, kind in self.COLUMN_TYPES.items()
+                },
+            }
+        )
+        # a single assignment, so concurrent requests see old or new settings
+        self.settings = settings
+
+    def reload(self) -> None:
+        """Read the settings again, e.g. on SIGHUP
+
+        The rate limit, timeout, schema TTL and database apply to the next
+        requests, the pool size only after a restart.
+        """
         self.setup_settings()
+        source = env_file() or "the environment"
+        logger.info(f"Reloaded the Notion settings from {source}")
 
-    def setup_settings(self) -> None:
-        """Setup the settings from the .env file"""
+    @property
+    def api_key(self) -> str:
+        return self.settings.api_key
 
-        load_dotenv()
-        self.ids_str = "_IDS" if self.use_ids else ""
-        self.api_key: str = os.getenv(f"NOTION_API_KEY{self.ids_str}")
-        self.page_url: str = os.getenv(f"NOTION_PAGE_URL{self.ids_str}")
-        self.database_id: str = self.get_page_id_from_url(self.page_url)
+    @property
+    def page_url(self) -> str:
+        return self.settings.page_url
 
-        logging.basicConfig(level=logging.DEBUG)
-        logger = logging.getLogger(__name__)
+    @property
+    def database_id(self) -> str:
+        return self.settings.database_id
 
-        self.database = Database(integrations_token=os.getenv("NOTION_API_KEY"))
+    @property
+    def pool_size(self) -> int:
+        return self.settings.pool_size
+
+    @property
+    def timeout(self) -> Union[float, tuple[float, float]]:
+        return self.settings.timeout
+
+    def get_schema(self) -> DatabaseSchema:
+        """Schema of the papers database, cached for NOTION_SCHEMA_TTL seconds
+
+        Returns:
+            DatabaseSchema: the retrieved schema, the expected one if it failed
+        """
+        database_id = self.database_id
+        try:
+            return self.schemas.get(database_id)
+        except Exception as e:
+            return self._fall_back_schema(database_id, e)
+
+    async def aget_schema(self) -> DatabaseSchema:
+        """Same as get_schema, without blocking the event loop"""
+        database_id = self.database_id
+        try:
+            return await self.schemas.aget(database_id)
+        except Exception as e:
+            return self._fall_back_schema(database_id, e)
+
+    def cached_schema(self) -> DatabaseSchema:
+        """Schema of the papers database without calling Notion
+
+        Returns:
+            DatabaseSchema: the cached schema, the expected one if none is
+        """
+        return self.schemas.cached(self.database_id) or self.expected_schema
+
+    def _fall_back_schema(self, database_id: str, error: Exception) -> DatabaseSchema:
+        logger.warning(f"Could not retrieve the database schema: {error!r}")
+        # not retried by every caller while Notion is down
+        self.schemas.put(database_id, self.expected_schema, ttl=SCHEMA_FALLBACK_TTL)
+        return self.expected_schema
+
+    @contextmanager
+    def invalidate_schema_on_error(self, database_id: str):
+        """Retrieve the schema again after Notion rejected properties built from it"""
+        try:
+            yield
+        except ValueError as e:
+            if str(e) == "validation_error":
+                self.schemas.invalidate(database_id)
+            raise
 
     def update(self, props_dict: dict[str, str], added_by: str) -> bool:
         """Update a notion page with a dictionary of properties
@@ -42,19 +228,214 @@ class NotionUpdater:
         Returns:
             bool: True if the update was successful
         """
-        props = self.generate_notion_properties(props_dict, added_by=added_by)
-        P = Page(integrations_token=self.api_key)
-        P.create_page(database_id=self.database_id, properties=props, children=None)
+        settings = self.settings
+        props = self.generate_notion_properties(
+            props_dict, added_by=added_by, schema=self.get_schema()
+        )
+        # Pages share the pooled session of the integration, so this is cheap
+        P = Page(
+            integrations_token=settings.api_key,
+            timeout=settings.timeout,
+            pool_size=settings.pool_size,
+        )
+        with self.invalidate_schema_on_error(settings.database_id):
+            P.create_page(
+                database_id=settings.database_id, properties=props, children=None
+            )
         return P
 
-    def generate_notion_properties(self, props_dict, added_by) -> Properties:
+    async def aupdate(self, props_dict: dict[str, str], added_by: str) -> AsyncPage:
+        """Create a notion page from a dictionary of properties without blocking
+
+        Args:
+            props_dict (dict): a dictionary of properties
+        Returns:
+            AsyncPage: the created page
+        """
+        settings = self.settings
+        props = self.generate_notion_properties(
+            props_dict, added_by=added_by, schema=await self.aget_schema()
+        )
+        P = AsyncPage(
+            integrations_token=settings.api_key,
+            timeout=settings.timeout,
+            pool_size=settings.pool_size,
+        )
+        with self.invalidate_schema_on_error(settings.database_id):
+            await P.create_page(
+                database_id=settings.database_id, properties=props, children=None
+            )
+        return P
+
+    def enqueue(
+        self,
+        queue: WriteQueue,
+        props_dict: dict[str, str],
+        added_by: str,
+        chat_id: int = None,
+        message_id: int = None,
+        schema: Optional[DatabaseSchema] = None,
+        keys: Iterable[str] = (),
+    ) -> int:
+        """Queue the creation of a notion page from a dictionary of properties
+
+        Args:
+            queue (WriteQueue): the queue drained by the background worker
+            props_dict (dict): a dictionary of properties
+            added_by (str): name of the user that shared the paper
+            chat_id (int): chat to reply to once the page is created
+            message_id (int): message to reply to once the page is created
+            schema (DatabaseSchema): schema of the database, the cached one if
+                not given: queuing never waits for Notion
+            keys (Iterable[str]): paper keys the queued page is found under
+                until it is created, see WriteQueue.lookup_keys
+        Returns:
+            int: the id of the queued page
+        """
+        schema = schema or self.cached_schema()
+        props = self.generate_notion_properties(
+            props_dict, added_by=added_by, schema=schema
+        )
+        payload = {
+            "database_id": self.database_id,
+            "properties": props.result,
+            "paper_props": props_dict,
+            "added_by": added_by,
+            # the properties are built again if the schema differs when written
+            "schema": schema.marker,
+        }
+        return queue.put(payload, chat_id=chat_id, message_id=message_id, keys=keys)
+
+    def append_to_page(self, page_id: str, children: Children) -> list[str]:
+        """Add blocks (notes, BibTeX, figures...) to the page of a saved paper
+
+        Args:
+            page_id (str): the id of the paper page
+            children (Children): the blocks to append
+        Returns:
+            list[str]: the ids of the created blocks
+        """
+        settings = self.settings
+        block = Block(
+            settings.api_key, timeout=settings.timeout, pool_size=settings.pool_size
+        )
+        return block.append_children(page_id, children)
+
+    async def aappend_to_page(self, page_id: str, children: Children) -> list[str]:
+        """Same as append_to_page, without blocking the event loop"""
+        settings = self.settings
+        block = AsyncBlock(
+            settings.api_key, timeout=settings.timeout, pool_size=settings.pool_size
+        )
+        return await block.append_children(page_id, children)
+
+    def find_page(self, url: str, database_id: str = None) -> Optional[dict]:
+        """Look for the page of a paper in Notion, e.g. after a create that failed
+        once Notion may have carried it out
+
+        Args:
+            url (str): the paper URL, as stored in the Link column
+            database_id (str): the database to search, the papers database if
+                not given
+        Returns:
+            dict: the Notion page object or None
+        """
+        settings = self.settings
+        database = Database(
+            integrations_token=settings.api_key,
+            timeout=settings.timeout,
+            pool_size=settings.pool_size,
+        )
+        pages = database.iter_pages(
+            database_id or settings.database_id,
+            filter={"property": "Link", "url": {"equals": url}},
+            page_size=1,
+        )
+        return next(iter(pages), None)
+
+    async def afind_page(self, url: str, database_id: str = None) -> Optional[dict]:
+        """Same as find_page, without blocking the event loop"""
+        settings = self.settings
+        database = AsyncDatabase(
+            integrations_token=settings.api_key,
+            timeout=settings.timeout,
+            pool_size=settings.pool_size,
+        )
+        pages = database.iter_pages(
+            database_id or settings.database_id,
+            filter={"property": "Link", "url": {"equals": url}},
+            page_size=1,
+        )
+        async for page in pages:
+            await pages.aclose()
+            return page
+        return None
+
+    async def create_queued_page(
+        self, payload: dict, check_existing: bool = False
+    ) -> AsyncPage:
+        """Create the notion page of a queued payload
+
+        The properties are built again when they were queued with another schema
+        than the cached one, e.g. the expected one while Notion was unreachable
+        or before a column was renamed or changed type.
+
+        Args:
+            payload (dict): a payload stored by enqueue
+            check_existing (bool): look for the page first, for payloads whose
+                previous attempt failed after Notion may have created it
+        Returns:
+            AsyncPage: the created page, or the one found
+        """
+        schema = self.schemas.cached(payload["database_id"])
+        if (
+            schema is not None
+            and "added_by" in payload
+            and payload.get("schema") != schema.marker
+        ):
+            props = self.generate_notion_properties(
+                payload["paper_props"], payload["added_by"], schema=schema
+            )
+        else:
+            props = Properties()
+            props.result.update(payload["properties"])
+        settings = self.settings
+        P = AsyncPage(
+            integrations_token=settings.api_key,
+            timeout=settings.timeout,
+            pool_size=settings.pool_size,
+        )
+        if check_existing:
+            page = await self.afind_page(
+                payload["paper_props"]["url"], database_id=payload["database_id"]
+            )
+            if page is not None:
+                logger.info(f"Page of {payload['paper_props']['url']} already exists")
+                P.result = page
+                return P
+        with self.invalidate_schema_on_error(payload["database_id"]):
+            await P.create_page(
+                database_id=payload["database_id"], properties=props, children=None
+            )
+        return P
+
+    def generate_notion_properties(
+        self,
+        props_dict: dict[str, str],
+        added_by: str,
+        schema: Optional[DatabaseSchema] = None,
+    ) -> Properties:
         """Generate a notion properties object from a dictionary
 
         Args:
             props_dict (dict): a dictionary of properties
+            added_by (str): name of the user that shared the paper
+            schema (DatabaseSchema): schema the properties are checked and
+                coerced against, the expected columns if not given
         Returns:
             props: a notion properties object
         """
+        schema = schema or self.expected_schema
 
         title = (
             props_dict["title"]
@@ -62,26 +443,22 @@ class NotionUpdater:
             else props_dict["title"][: self.PAGE_TITLE_MAX_LENGTH] + "..."
         )
 
-        authors = props_dict["authors"].split(", ")
-
-        abstract = props_dict["abstract"].strip().replace("\n", " ")
-        pub_date = props_dict["date"]
-        url = props_dict["url"]
-        doi = props_dict["doi"]
-
-        props = Properties()
-        props.set_select("Type", "Papers")
-        props.set_title("Name", title)
-        props.set_multi_select("Authors", authors)
-        props.set_url("Link", url)
-        props.set_rich_text("Publication Date", pub_date)
-        props.set_rich_text("Abstract", abstract)
-        props.set_rich_text("Added By", added_by)
-        props.set_rich_text("Date Added", date.today().strftime("%Y-%m-%d"))
-
-        return props
+        return schema.build(
+            {
+                "Type": "Papers",
+                # the title column may have been renamed
+                schema.title_property: title,
+                "Authors": props_dict["authors"].split(", "),
+                "Link": props_dict["url"],
+                "Publication Date": props_dict["date"],
+                "Abstract": props_dict["abstract"].strip().replace("\n", " "),
+                "Added By": added_by,
+                "Date Added": date.today().strftime("%Y-%m-%d"),
+            }
+        )
 
-    def get_page_id_from_url(self, url: str) -> str:
+    @staticmethod
+    def get_page_id_from_url(url: str) -> str:
         """Get the page id from the url
 
         Args:
@@ -90,8 +467,7 @@ class NotionUpdater:
         Returns:
             str: an id from the url
         """
-        id_regex = re.compile(r"([\w|\d]{32}$)")
-        id_raw = id_regex.findall(url)[0]
+        id_raw = NOTION_PAGE_ID_REGEX.findall(url)[0]
         id_processed = "-".join(
             [id_raw[0:8], id_raw[8:12], id_raw[12:16], id_raw[16:20], id_raw[20:]]
         )
@@ -0,0 +1,150 @@
+"""Local index of the papers already saved to Notion.
+
+Papers are indexed by normalized URL, arXiv ID and DOI so a shared link can be
+recognized without fetching the paper or querying Notion.
+
+@author: @steppf
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from src.notion_database.database import Database
+from src.utils.parser_utils import extract_arxiv_id, extract_doi, normalize_url
+
+DEFAULT_PAPER_INDEX_PATH = "paper_index.sqlite3"
+
+logger = logging.getLogger(__name__)
+
+
+class SavedPaper(NamedTuple):
+    page_id: str
+    page_url: str
+    title: str
+
+
+def keys_for_url(url: str) -> list[str]:
+    """Index keys of a paper URL."""
+    keys = [f"url:{normalize_url(url)}"]
+    arxiv_id = extract_arxiv_id(url)
+    if arxiv_id:
+        keys.append(f"arxiv:{arxiv_id}")
+    doi = extract_doi(url)
+    if doi:
+        keys.append(f"doi:{doi}")
+    return keys
+
+
+def keys_for_props(paper_props: dict[str, str]) -> list[str]:
+    """Index keys of the properties returned by PaperParser.extract_props."""
+    keys = keys_for_url(paper_props["url"])
+    # arXiv stores its identifier in the doi field
+    identifier = paper_props.get("doi") or ""
+    arxiv_id = extract_arxiv_id(f"arXiv:{identifier}")
+    doi = extract_doi(identifier)
+    if doi:
+        keys.append(f"doi:{doi}")
+    elif arxiv_id:
+        keys.append(f"arxiv:{arxiv_id}")
+    return list(dict.fromkeys(keys))
+
+
+class PaperIndex:
+    """SQLite backed index of saved papers."""
+
+    def __init__(self, path: str = DEFAULT_PAPER_INDEX_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS papers (
+                key TEXT PRIMARY KEY,
+                page_id TEXT NOT NULL,
+                page_url TEXT NOT NULL,
+                title TEXT,
+                added_at REAL NOT NULL
+            )
+            """
+        )
+
+    def lookup(self, url: str) -> Optional[SavedPaper]:
+        """Find a saved paper from a shared URL
+
+        Args:
+            url (str): the shared URL
+        Returns:
+            SavedPaper: the saved paper or None
+        """
+        return self.lookup_keys(keys_for_url(url))
+
+    def lookup_keys(self, keys: list[str]) -> Optional[SavedPaper]:
+        """Find a saved paper indexed under any of keys"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_id, page_url, title FROM papers "
+                f"WHERE key IN ({', '.join('?' * len(keys))}) LIMIT 1",
+                keys,
+            ).fetchone()
+        return SavedPaper(*row) if row else None
+
+    def add(self, keys: list[str], page_id: str, page_url: str, title: str) -> None:
+        """Index a saved paper under every one of its keys"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO papers (key, page_id, page_url, title, "
+                "added_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, page_id, page_url, title, now) for key in keys],
+            )
+
+    def add_page(self, paper_props: dict[str, str], page_result: dict) -> None:
+        """Index a page created from the properties of a paper"""
+        self.add(
+            keys_for_props(paper_props),
+            page_result["id"],
+            page_result["url"],
+            paper_props["title"],
+        )
+
+    def backfill(
+        self,
+        database: Database,
+        database_id: str,
+        url_property: str = "Link",
+        title_property: str = "Name",
+    ) -> int:
+        """Index every page of a Notion database
+
+        Args:
+            database (Database): a Notion database client
+            database_id (str): the papers database
+            url_property (str): the url column
+            title_property (str): the title column
+        Returns:
+            int: number of indexed pages
+        """
+        count = 0
+        for page in database.iter_pages(database_id, prefetch=True):
+            properties = page["properties"]
+            url = properties.get(url_property, {}).get("url")
+            if not url:
+                continue
+            title = "".join(
+                text["plain_text"]
+                for text in properties.get(title_property, {}).get("title", [])
+            )
+            self.add(keys_for_url(url), page["id"], page["url"], title)
+            count += 1
+
+        logger.info(f"Indexed {count} saved papers")
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -7,24 +7,31 @@
 @author: @steppf
 """
 
-import importlib
+import json
+import os
 import re
 from distutils.command.config import config
 from typing import Optional
-from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup
-
-from src.utils.parser_utils import join_authors
-from src.utils.request_utils import DefaultSession
+from src.parsers.arxiv import ArxivAPI
+from src.parsers.registry import get_registry
+from src.utils.cache_utils import get_cache
+from src.utils.parser_utils import (
+    MetaIndex,
+    decode_html,
+    extract_arxiv_id,
+    join_authors,
+    normalize_url,
+)
+from src.utils.request_utils import DEFAULT_HEAD_MAX_BYTES, get_session_manager
 
 
 class PaperParser:
     """
     Parser that extracts the following properties from a paper html.
 
-    1. We use the BeautifulSoup library to parse the html code of the page that we are interested in.
-    2. We extract data from the page using the find() and findAll() methods of the BeautifulSoup class.
+    1. We stream the <head> of the page through a MetaExtractor, indexing every <meta> tag in one pass.
+    2. We answer every Config.meta lookup (names or regexes) from that MetaIndex.
     3. Finally, we return the dictionary containing the extracted properties.
     """
 
@@ -32,48 +39,61 @@ class PaperParser:
         self.url = url
         self.logger = logger
         self.parser = self._get_parser(self.url)
-        self.session = DefaultSession(headers=self.parser.headers)
-        self.soup = self._get_soup(self.url)
+        # shared by every parser of the host, provider headers go with each request
+        self.session = get_session_manager().session(self.fetch_url)
+        self.meta_index = self._get_meta_index(self.fetch_url)
 
     def _get_parser(self, url: str):
-        provider = urlparse(url).netloc.split(".")[-2]
-        self.logger.info(f"Provider: {provider}")
-
-        provider_module = f"src.parsers.{provider}"
-        provider_module = importlib.import_module(provider_module)
+        provider = get_registry().resolve(url)
+        self.logger.info(f"Provider: {provider.name}")
 
-        parser = provider_module.Config(url)
+        self.fetch_url = provider.canonical_url(url)
+        parser = provider.config(url)
         return parser
 
-    def _get_soup(self, url: str):
-        response = self.session.get(url)
+    def _get_meta_index(self, url: str) -> MetaIndex:
+        response = self.session.get(
+            url,
+            head_only=True,
+            headers=self.parser.headers,
+            cache=get_cache("responses"),
+            max_bytes=int(os.getenv("HEAD_MAX_BYTES", DEFAULT_HEAD_MAX_BYTES)),
+        )
 
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, "html.parser")
-            return soup
+            # requests falls back to ISO-8859-1 when the charset is not in the headers
+            content_type = response.headers.get("Content-Type", "")
+            encoding = response.encoding if "charset" in content_type else None
+            return MetaIndex.from_html(decode_html(response.content, encoding))
 
         raise ConnectionError(
-            f"{url} \nError: {response.status_code}, {response.reason} \nHeaders: {self.session.headers}"
+            f"{url} \nError: {response.status_code}, {response.reason} \nHeaders: {self.parser.headers}"
         )
 
+    def _find_meta(self, name) -> str:
+        content = self.meta_index.find(name)
+        if content is None:
+            raise ValueError(f"Meta tag {name} not found in {self.url}")
+        return content
+
     def _get_title(self):
         title_meta = self.parser.meta["title"]
-        title = self.soup.find("meta", attrs={"name": title_meta})
-        title = title.get("content").strip()
+        title = self._find_meta(title_meta)
+        title = title.strip()
         return title
 
     def _get_authors(self):
         author_meta = self.parser.meta["author"]
         authors = [
-            self.parser.parse_author(tag.get("content")).strip()
-            for tag in self.soup.findAll("meta", attrs={"name": author_meta})
+            self.parser.parse_author(content).strip()
+            for content in self.meta_index.find_all(author_meta)
         ]
 
         return authors
 
     def _get_date(self):
         date_meta = self.parser.meta["date"]
-        date = self.soup.find("meta", attrs={"name": date_meta}).get("content")
+        date = self._find_meta(date_meta)
         date = date.strip()
         return date
 
@@ -83,9 +103,7 @@ class PaperParser:
         if self.url.startswith("http"):
             citation_url = self.url
         else:
-            citation_url = self.soup.find("meta", attrs={"name": url_meta}).get(
-                "content"
-            )
+            citation_url = self._find_meta(url_meta)
 
         citation_url = citation_url.strip()
         return citation_url
@@ -94,16 +112,13 @@ class PaperParser:
         doi_meta = self.parser.meta["doi"]
         if doi_meta is None:
             return ""
-        doi = self.soup.find("meta", attrs={"name": doi_meta}).get("content")
+        doi = self._find_meta(doi_meta)
         doi = doi.strip()
         return doi
 
     def _get_abstract(self):
         abstract_meta = self.parser.meta["abstract"]
-        abstract = self.soup.find(
-            "meta",
-            attrs={"name": abstract_meta},
-        ).get("content")
+        abstract = self._find_meta(abstract_meta)
         abstract = abstract.strip()
         abstract = re.sub(r"'(?:\\n)+", " ", str(abstract))
         abstract = " ".join(abstract.splitlines())
@@ -142,6 +157,22 @@ class PaperParser:
         return self.paper_props
 
 
+def _get_cached_props(url: str) -> Optional[dict[str, str]]:
+    props_cache = get_cache("paper_props")
+    if props_cache is None:
+        return None
+    entry = props_cache.get(normalize_url(url))
+    if entry is not None and entry.fresh:
+        return json.loads(entry.data)
+    return None
+
+
+def _cache_props(url: str, paper_props: dict[str, str]) -> None:
+    props_cache = get_cache("paper_props")
+    if props_cache is not None:
+        props_cache.set(normalize_url(url), json.dumps(paper_props).encode())
+
+
 def get_paper_props(url: str, logger=Optional) -> dict[str, str]:
     """
     Extract and format paper properties from a given URL.
@@ -153,6 +184,52 @@ def get_paper_props(url: str, logger=Optional) -> dict[str, str]:
     """
     logger.info(f"Getting paper props for {url}")
 
+    paper_props = _get_cached_props(url)
+    if paper_props is not None:
+        logger.info(f"Paper props of {url} found in cache")
+        return paper_props
+
     parser = PaperParser(url, logger)
     paper_props = parser.extract_props()
+
+    _cache_props(url, paper_props)
     return paper_props
+
+
+def get_arxiv_papers_props(urls: list[str], logger=Optional) -> dict[str, dict]:
+    """
+    Resolve every arXiv URL of a list with a single query to the arXiv API.
+
+    Set ARXIV_BACKEND=html to always scrape the abs pages instead. This never
+    raises: URLs missing from the result are left to get_paper_props, the HTML path.
+
+    Args:
+        urls (list[str]): URLs of papers, from any provider.
+    Returns:
+        dict[str, dict]: paper properties by URL.
+    """
+    if os.getenv("ARXIV_BACKEND", "api") != "api":
+        return {}
+
+    papers_props = {}
+    missing_urls = []
+    for url in urls:
+        paper_props = _get_cached_props(url)
+        if paper_props is not None:
+            papers_props[url] = paper_props
+        elif extract_arxiv_id(url):
+            missing_urls.append(url)
+    if not missing_urls:
+        return papers_props
+
+    logger.info(f"Getting paper props of {len(missing_urls)} urls from the arXiv API")
+    try:
+        api_props = ArxivAPI().get_papers_props(missing_urls)
+    except Exception as e:
+        logger.warning(f"arXiv API failed, falling back to the abs pages: {e!r}")
+        return papers_props
+
+    for url, paper_props in api_props.items():
+        _cache_props(url, paper_props)
+    papers_props.update(api_props)
+    return papers_props
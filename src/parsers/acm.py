@@ -1,5 +1,12 @@
 import re
 
+HOSTS = ("acm.org",)
+DOI_PREFIXES = ("10.1145",)
+
+
+def doi_url(doi):
+    return f"https://dl.acm.org/doi/{doi}"
+
 
 class Config:
     """
@@ -1,4 +1,26 @@
+import os
 import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from src.utils.parser_utils import extract_arxiv_id, join_authors
+from src.utils.request_utils import get_session_manager
+
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+# the export API accepts long id_list queries, but keeps responses reasonably small
+ARXIV_API_BATCH_SIZE = 50
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV = "{http://arxiv.org/schemas/atom}"
+
+HOSTS = ("arxiv.org",)
+DOI_PREFIXES = ("10.48550",)
+
+
+def doi_url(doi):
+    """
+    arXiv DOIs embed the identifier: 10.48550/arXiv.1706.03762
+    """
+    return f"https://arxiv.org/abs/{doi.split('/', 1)[1][len('arxiv.'):]}"
 
 
 class Config:
@@ -19,3 +41,103 @@ class Config:
         Parse author string into a string of "first name, last name"
         """
         return author
+
+
+class ArxivAPI:
+    """
+    Client of the arXiv Atom export API, resolving many identifiers with a single
+    id_list query instead of scraping one abs page per paper.
+    """
+
+    def __init__(self, api_url=None, batch_size=ARXIV_API_BATCH_SIZE):
+        self.api_url = api_url or os.getenv("ARXIV_API_URL", ARXIV_API_URL)
+        self.batch_size = batch_size
+        self.session = get_session_manager().session(self.api_url)
+
+    def fetch(self, arxiv_ids):
+        """
+        Fetch the metadata of arXiv papers
+
+        Args:
+            arxiv_ids (list[str]): identifiers without version
+        Returns:
+            dict[str, dict]: title, authors, date, arxiv_id and abstract by identifier,
+            identifiers unknown to arXiv are left out
+        """
+        arxiv_ids = list(dict.fromkeys(arxiv_ids))
+        papers = {}
+        for start in range(0, len(arxiv_ids), self.batch_size):
+            batch = arxiv_ids[start : start + self.batch_size]
+            response = self.session.get(
+                self.api_url,
+                params={"id_list": ",".join(batch), "max_results": len(batch)},
+            )
+            if response.status_code != 200:
+                raise ConnectionError(
+                    f"{self.api_url} \nError: {response.status_code}, {response.reason}"
+                )
+            papers.update(self.parse_feed(response.content))
+        return papers
+
+    @staticmethod
+    def parse_feed(content):
+        """
+        Parse an Atom feed returned by the API
+
+        Args:
+            content (bytes): the feed
+        Returns:
+            dict[str, dict]: papers by identifier
+        """
+        papers = {}
+        for entry in ET.fromstring(content).iter(f"{ATOM}entry"):
+            arxiv_id = extract_arxiv_id(entry.findtext(f"{ATOM}id", ""))
+            title = entry.findtext(f"{ATOM}title")
+            # unknown identifiers come back as an "Error" entry
+            if arxiv_id is None or title is None:
+                continue
+
+            published = entry.findtext(f"{ATOM}published", "")[:10]
+            papers[arxiv_id] = {
+                "title": " ".join(title.split()),
+                "authors": [
+                    author.findtext(f"{ATOM}name", "").strip()
+                    for author in entry.iter(f"{ATOM}author")
+                ],
+                "date": datetime.strptime(published, "%Y-%m-%d").strftime("%Y/%m/%d"),
+                "arxiv_id": arxiv_id,
+                "doi": entry.findtext(f"{ARXIV}doi", ""),
+                "abstract": " ".join(entry.findtext(f"{ATOM}summary", "").split()),
+            }
+        return papers
+
+    def get_papers_props(self, urls):
+        """
+        Paper properties, as returned by PaperParser.extract_props, of arXiv URLs
+
+        Args:
+            urls (list[str]): URLs, non arXiv ones are ignored
+        Returns:
+            dict[str, dict]: paper properties by URL, for the papers arXiv knows
+        """
+        ids_by_url = {url: extract_arxiv_id(url) for url in urls}
+        ids_by_url = {url: arxiv_id for url, arxiv_id in ids_by_url.items() if arxiv_id}
+        if not ids_by_url:
+            return {}
+
+        papers = self.fetch(list(ids_by_url.values()))
+        props = {}
+        for url, arxiv_id in ids_by_url.items():
+            paper = papers.get(arxiv_id)
+            if paper is None:
+                continue
+            props[url] = {
+                "title": paper["title"],
+                "authors": join_authors(paper["authors"]),
+                "date": paper["date"],
+                "url": url,
+                # same as the citation_arxiv_id meta tag of the abs page
+                "doi": paper["arxiv_id"],
+                "abstract": paper["abstract"],
+            }
+        return props
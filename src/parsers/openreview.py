@@ -1,4 +1,17 @@
 import re
+from urllib.parse import urlparse
+
+HOSTS = ("openreview.net",)
+
+
+def canonical_url(url):
+    """
+    PDF links (/pdf?id=...) have no metadata, use the forum page of the paper
+    """
+    parsed = urlparse(url)
+    if parsed.path.rstrip("/") == "/pdf":
+        return parsed._replace(path="/forum").geturl()
+    return url
 
 
 class Config:
@@ -1,5 +1,12 @@
 import re
 
+HOSTS = ("pnas.org",)
+DOI_PREFIXES = ("10.1073",)
+
+
+def doi_url(doi):
+    return f"https://www.pnas.org/doi/{doi}"
+
 
 class Config:
     def __init__(self, url):
@@ -0,0 +1,131 @@
+"""Registry of the paper providers.
+
+Every module of src/parsers (and every module exposed through the
+"papers_to_notion.parsers" entry point group) describing a provider defines:
+
+- Config: the class configuring PaperParser for the provider.
+- HOSTS: the hostnames served by the provider, subdomains included.
+- canonical_url (optional): a function mapping a shared URL to the page holding
+  the metadata, e.g. a PDF link to its abstract page.
+- DOI_PREFIXES and doi_url (optional): the DOI registrant prefixes of the provider
+  and a function turning one of its DOIs into a paper URL.
+
+The modules are imported once and their hosts are indexed, so resolving a URL is a
+few dictionary lookups.
+
+@author: @steppf
+"""
+import importlib
+import importlib.metadata as importlib_metadata
+import logging
+import pkgutil
+import threading
+from typing import Callable, NamedTuple, Optional
+from urllib.parse import urlparse
+
+ENTRY_POINT_GROUP = "papers_to_notion.parsers"
+
+logger = logging.getLogger(__name__)
+
+
+class Provider(NamedTuple):
+    name: str
+    config: type
+    canonical_url: Callable[[str], str]
+    doi_url: Optional[Callable[[str], str]]
+
+
+def _same_url(url: str) -> str:
+    return url
+
+
+class ProviderRegistry:
+    """Host to provider dispatch table."""
+
+    def __init__(self) -> None:
+        self.providers: dict[str, Provider] = {}
+        self.hosts: dict[str, Provider] = {}
+        self.doi_prefixes: dict[str, Provider] = {}
+
+    def register(
+        self,
+        name: str,
+        config: type,
+        hosts: tuple,
+        canonical_url: Optional[Callable[[str], str]] = None,
+        doi_prefixes: tuple = (),
+        doi_url: Optional[Callable[[str], str]] = None,
+    ) -> Provider:
+        """Register a provider for hosts and all their subdomains"""
+        provider = Provider(name, config, canonical_url or _same_url, doi_url)
+        self.providers[name] = provider
+        for host in hosts:
+            self.hosts[host.lower()] = provider
+        if doi_url is not None:
+            for prefix in doi_prefixes:
+                self.doi_prefixes[prefix] = provider
+        return provider
+
+    def register_module(self, name: str, module) -> Optional[Provider]:
+        """Register a provider module, modules without HOSTS are skipped"""
+        if not hasattr(module, "HOSTS") or not hasattr(module, "Config"):
+            return None
+        return self.register(
+            name,
+            module.Config,
+            module.HOSTS,
+            canonical_url=getattr(module, "canonical_url", None),
+            doi_prefixes=getattr(module, "DOI_PREFIXES", ()),
+            doi_url=getattr(module, "doi_url", None),
+        )
+
+    def load(self) -> "ProviderRegistry":
+        """Import the bundled providers and the entry point plugins"""
+        package = importlib.import_module("src.parsers")
+        for module_info in pkgutil.iter_modules(package.__path__):
+            if module_info.name == "registry":
+                continue
+            module = importlib.import_module(f"src.parsers.{module_info.name}")
+            self.register_module(module_info.name, module)
+
+        for entry_point in importlib_metadata.entry_points(group=ENTRY_POINT_GROUP):
+            try:
+                self.register_module(entry_point.name, entry_point.load())
+            except Exception as e:
+                logger.error(f"Could not load parser plugin {entry_point.name}: {e}")
+
+        logger.info(f"Loaded providers: {', '.join(self.providers)}")
+        return self
+
+    def resolve(self, url: str) -> Provider:
+        """
+        Find the provider of a URL, from its full hostname down to its
+        registrable domain (export.arxiv.org, then arxiv.org)
+        """
+        host = (urlparse(url).hostname or "").lower()
+        labels = host.split(".")
+        for i in range(len(labels) - 1):
+            provider = self.hosts.get(".".join(labels[i:]))
+            if provider is not None:
+                return provider
+        raise ValueError(f"No parser for {host or url}")
+
+    def url_for_doi(self, doi: str) -> str:
+        """Paper URL of a DOI, from the provider owning its registrant prefix"""
+        provider = self.doi_prefixes.get(doi.split("/", 1)[0])
+        if provider is None:
+            raise ValueError(f"No parser for DOI {doi}")
+        return provider.doi_url(doi)
+
+
+_REGISTRY: Optional[ProviderRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry() -> ProviderRegistry:
+    """Return the process wide registry, loading it on first use."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ProviderRegistry().load()
+    return _REGISTRY
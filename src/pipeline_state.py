@@ -0,0 +1,124 @@
+"""Checkpoints of batch ingestion runs.
+
+Every URL of a run goes through the stages below and each transition is recorded
+in SQLite, so a run interrupted at any point resumes where it stopped instead of
+fetching and writing everything again.
+
+    pending -> parsed -> writing -> written
+                     \\-> failed (retried when the run is resumed)
+
+Fetched pages are not checkpointed here: they already live in the response cache.
+
+@author: @steppf
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+DEFAULT_PIPELINE_STATE_PATH = "pipeline_state.sqlite3"
+
+PENDING, PARSED, WRITING, WRITTEN, FAILED = (
+    "pending",
+    "parsed",
+    "writing",
+    "written",
+    "failed",
+)
+
+
+class ItemState(NamedTuple):
+    url: str
+    stage: str
+    paper_props: Optional[dict]
+    page_id: Optional[str]
+    page_url: Optional[str]
+    error: Optional[str]
+
+
+class PipelineState:
+    """SQLite backed state of ingestion runs, one row per run and URL."""
+
+    def __init__(self, path: str = DEFAULT_PIPELINE_STATE_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                run_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                paper_props TEXT,
+                page_id TEXT,
+                page_url TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, url)
+            )
+            """
+        )
+
+    def get(self, run_id: str, url: str) -> Optional[ItemState]:
+        """State of a URL in a run, None if the run never saw it"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, stage, paper_props, page_id, page_url, error FROM items "
+                "WHERE run_id = ? AND url = ?",
+                (run_id, url),
+            ).fetchone()
+        if row is None:
+            return None
+        url, stage, paper_props, page_id, page_url, error = row
+        return ItemState(
+            url,
+            stage,
+            json.loads(paper_props) if paper_props else None,
+            page_id,
+            page_url,
+            error,
+        )
+
+    def _set(self, run_id: str, url: str, stage: str, **values) -> None:
+        columns = ["stage", "updated_at", *values]
+        params = [stage, time.time(), *values.values()]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO items (run_id, url, {', '.join(columns)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(columns))}) "
+                "ON CONFLICT (run_id, url) DO UPDATE SET "
+                + ", ".join(f"{column} = excluded.{column}" for column in columns),
+                [run_id, url, *params],
+            )
+
+    def mark_pending(self, run_id: str, url: str) -> None:
+        self._set(run_id, url, PENDING)
+
+    def mark_parsed(self, run_id: str, url: str, paper_props: dict) -> None:
+        self._set(run_id, url, PARSED, paper_props=json.dumps(paper_props), error=None)
+
+    def mark_writing(self, run_id: str, url: str) -> None:
+        self._set(run_id, url, WRITING)
+
+    def mark_written(self, run_id: str, url: str, page_id: str, page_url: str) -> None:
+        self._set(run_id, url, WRITTEN, page_id=page_id, page_url=page_url, error=None)
+
+    def mark_failed(self, run_id: str, url: str, error: str) -> None:
+        self._set(run_id, url, FAILED, error=error)
+
+    def counts(self, run_id: str) -> dict[str, int]:
+        """Number of URLs of a run in each stage"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, COUNT(*) FROM items WHERE run_id = ? GROUP BY stage",
+                (run_id,),
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
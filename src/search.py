@@ -6,7 +6,12 @@ else:
     from typing_extensions import TypedDict
 
 from notion_database.query import Direction, Timestamp
-from notion_database.request import Request
+from notion_database.request import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_TIMEOUT,
+    Request,
+    get_base_url,
+)
 
 
 class SortType(TypedDict):
@@ -15,16 +20,25 @@ class SortType(TypedDict):
 
 
 class Search:
-    def __init__(self, integrations_token):
+    def __init__(
+        self, integrations_token, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE
+    ):
         """
         init
 
         :param integrations_token: Notion Internal Integration Token
+        :param timeout: requests timeout, seconds or a (connect, read) tuple
+        :param pool_size: connection pool size of the shared session
         """
         self.properties_list = []
-        self.url = 'https://api.notion.com/v1/search'
+        self.url = get_base_url() + "/search"
         self.result = {}
-        self.request = Request(self.url, integrations_token=integrations_token)
+        self.request = Request(
+            self.url,
+            integrations_token=integrations_token,
+            timeout=timeout,
+            pool_size=pool_size,
+        )
 
     def search_database(self, query: str, sort: SortType, root_only=True):
         """
@@ -58,12 +72,29 @@ class Search:
         :param start_cursor: returns a page of results starting after the cursor provided.
         :return:
         """
-        if start_cursor:
-            self.result = self.request.call_api_post(self.url + "/", {
-                "query": query, "sort": {"direction": sort["direction"].value, "timestamp": sort["timestamp"].value},
-                "filter": {"value": "page", "property": "object"}, "page_size": page_size, "start_cursor": start_cursor
-            })
-        self.result = self.request.call_api_post(self.url + "/", {
+        body = {
             "query": query, "sort": {"direction": sort["direction"].value, "timestamp": sort["timestamp"].value},
             "filter": {"value": "page", "property": "object"}, "page_size": page_size
-        })
+        }
+        if start_cursor:
+            body["start_cursor"] = start_cursor
+        self.result = self.request.call_api_post(self.url + "/", body)
+
+    def iter_pages(self, query: str, sort: SortType, page_size=100):
+        """
+        Iterate over every matching page, following next_cursor lazily
+
+        :param query: matches against the pages titles.
+        :param sort: sort query specifically for only pages.
+        :param page_size: The number of items requested per search.
+        :return: generator of Notion page objects
+        """
+        self.search_pages(query, sort, page_size=page_size)
+        while True:
+            if self.result.get("object") == "error":
+                raise ValueError(self.result.get("code"))
+            result = self.result
+            yield from result["results"]
+            if not result.get("has_more"):
+                return
+            self.search_pages(query, sort, page_size=page_size, start_cursor=result["next_cursor"])
@@ -5,14 +5,21 @@ It works by extracting a paper's site metadata.
 
 @author: @steppf
 """
+import asyncio
+import html
 import logging
 import os
+import secrets
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
 from re import I
-from typing import Dict
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
 from telegram import ForceReply, Update
-from telegram.constants import MessageEntityType
+from telegram.constants import MessageEntityType, ParseMode
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -21,9 +28,22 @@ from telegram.ext import (
     filters,
 )
 
-from src.notion_updater import NotionUpdater
-from src.parser import get_paper_props
-from src.utils.parser_utils import extract_urls
+from src.importer import BulkImporter, ImportProgress, read_reading_list
+from src.notion_database.database import Database
+from src.notion_database.request import aclose_async_clients
+from src.notion_updater import NotionUpdater, env_file
+from src.paper_index import (
+    DEFAULT_PAPER_INDEX_PATH,
+    PaperIndex,
+    keys_for_props,
+    keys_for_url,
+)
+from src.parser import get_arxiv_papers_props, get_paper_props
+from src.parsers.registry import get_registry
+from src.pipeline_state import DEFAULT_PIPELINE_STATE_PATH, PipelineState
+from src.utils.parser_utils import extract_arxiv_id, extract_urls
+from src.utils.retry_utils import backoff_delay
+from src.write_queue import DEFAULT_WRITE_QUEUE_PATH, WriteQueue
 
 # Enable logging
 logging.basicConfig(
@@ -31,6 +51,84 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Paper extraction is blocking (requests + BeautifulSoup), so it runs on a bounded
+# thread pool instead of the event loop.
+DEFAULT_EXTRACTION_WORKERS = 8
+_extraction_pool: Optional[ThreadPoolExecutor] = None
+
+# Pages are created in Notion by a background job draining the write queue
+WRITE_QUEUE_INTERVAL = 2
+WRITE_QUEUE_BATCH_SIZE = 10
+WRITE_QUEUE_MAX_ATTEMPTS = 8
+# seconds between two edits of an import status message
+IMPORT_PROGRESS_INTERVAL = 5
+# updates handled at the same time, in polling and webhook mode
+DEFAULT_CONCURRENT_UPDATES = 8
+# BOT_MODE=webhook listens for the updates pushed by Telegram instead of polling
+DEFAULT_BOT_MODE = "polling"
+DEFAULT_WEBHOOK_LISTEN = "127.0.0.1"
+DEFAULT_WEBHOOK_PORT = 8443
+DEFAULT_WEBHOOK_MAX_CONNECTIONS = 40
+# Notion error codes that will not go away by retrying
+PERMANENT_ERRORS = {
+    "invalid_json",
+    "invalid_request_url",
+    "invalid_request",
+    "validation_error",
+    "missing_version",
+    "unauthorized",
+    "restricted_resource",
+    "object_not_found",
+}
+
+
+def get_extraction_pool() -> ThreadPoolExecutor:
+    """Return the shared extraction pool, creating it on first use."""
+    global _extraction_pool
+    if _extraction_pool is None:
+        max_workers = int(os.getenv("EXTRACTION_WORKERS", DEFAULT_EXTRACTION_WORKERS))
+        _extraction_pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="paper-extraction"
+        )
+    return _extraction_pool
+
+
+async def extract_papers(urls: list[str]) -> list:
+    """Extract the properties of every url concurrently.
+
+    Args:
+        urls (list[str]): urls found in a message
+    Returns:
+        list: paper properties or the exception raised for each url, in order
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+
+    async def scrape(urls):
+        props = await asyncio.gather(
+            *[loop.run_in_executor(pool, get_paper_props, url, logger) for url in urls],
+            return_exceptions=True,
+        )
+        return dict(zip(urls, props))
+
+    async def query_arxiv(urls):
+        if not urls:
+            return {}
+        props = await loop.run_in_executor(pool, get_arxiv_papers_props, urls, logger)
+        # links the API could not resolve are scraped
+        props.update(await scrape([url for url in urls if url not in props]))
+        return props
+
+    # all arXiv links are resolved by one API query, the other links are scraped
+    # meanwhile
+    arxiv_urls = [url for url in urls if extract_arxiv_id(url)]
+    other_urls = [url for url in urls if url not in arxiv_urls]
+    arxiv_props, scraped_props = await asyncio.gather(
+        query_arxiv(arxiv_urls), scrape(other_urls)
+    )
+    papers_props = {**arxiv_props, **scraped_props}
+    return [papers_props[url] for url in urls]
+
 
 # Define a few command handlers. These usually take the two arguments update and
 # context.
@@ -54,58 +152,324 @@ async def save_paper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     urls = extract_urls(update.message)
     logger.info(f"Found urls: {urls}")
 
-    paper_props_list = []
+    write_queue = context.bot_data["write_queue"]
+    new_urls = []
     for url in urls:
-        try:
-            paper_props = get_paper_props(url, logger=logger)
+        if not await reply_if_known(update, keys_for_url(url), url, context):
+            new_urls.append(url)
+    urls = new_urls
 
-        except Exception as e:
-            logger.error(e)
-            await update.message.reply_text(f"Error while extracting! {e}")
-            return None
+    paper_props_list = []
+    for url, paper_props in zip(urls, await extract_papers(urls)):
+        if isinstance(paper_props, Exception):
+            logger.error(paper_props)
+            await update.message.reply_text(
+                f"Error while extracting {url}! {paper_props}"
+            )
+            continue
 
-        paper_props_list.append(paper_props)
+        paper_props_list.append((url, paper_props))
 
-    for paper_props in paper_props_list:
-        updater = NotionUpdater()
-        update_response = updater.update(
-            paper_props, added_by=update.message.from_user.first_name
+    updater = context.bot_data["notion_updater"]
+    queued = 0
+    for url, paper_props in paper_props_list:
+        # another link of the paper may have been queued while it was extracted
+        keys = list(dict.fromkeys(keys_for_props(paper_props) + keys_for_url(url)))
+        if await reply_if_known(update, keys, url, context):
+            continue
+        updater.enqueue(
+            write_queue,
+            paper_props,
+            added_by=update.message.from_user.first_name,
+            chat_id=update.effective_chat.id,
+            message_id=update.message.message_id,
+            keys=keys,
         )
+        queued += 1
+    logger.info(f"Queued {queued} papers")
+
+    return None
+
+
+async def reply_if_known(
+    update: Update, keys: list[str], url: str, context: ContextTypes.DEFAULT_TYPE
+) -> bool:
+    """Tell the user when a paper is already saved or waiting to be saved.
 
-        database_url = "https://www.notion.so/"
-        database_url = (
-            database_url
-            + update_response.result["parent"]["database_id"]
-            + "?v=24bd580ba8164a619bff279cb7decf46"  ## Notion Version??
+    Returns:
+        bool: True if the paper is known
+    """
+    saved_paper = context.bot_data["paper_index"].lookup_keys(keys)
+    if saved_paper is not None:
+        logger.info(f"Already saved: {url}")
+        await update.message.reply_html(
+            f"<b>Already saved</b> → {html.escape(saved_paper.title or url)}\n"
+            f"Notion Page: {saved_paper.page_url}"
+        )
+        return True
+    if context.bot_data["write_queue"].lookup_keys(keys) is not None:
+        logger.info(f"Already queued: {url}")
+        await update.message.reply_html(
+            f"<b>Already queued</b> → {html.escape(url)}\n"
+            "Its Notion page is on the way."
         )
+        return True
+    return False
+
+
+def saved_paper_message(paper_props: dict, page_result: dict) -> str:
+    """Format the reply sent once a paper page exists in Notion."""
+    database_url = "https://www.notion.so/"
+    database_url = (
+        database_url
+        + page_result["parent"]["database_id"]
+        + "?v=24bd580ba8164a619bff279cb7decf46"  ## Notion Version??
+    )
+
+    logger.info(f"Saved to notion: {database_url}")
+
+    page_url = page_result["url"]
+    logger.info(f"Notion Page URL: {page_url}")
+
+    title, authors, date, citation_url, abstract = (
+        paper_props["title"],
+        paper_props["authors"],
+        paper_props["date"],
+        paper_props["url"],
+        paper_props["abstract"].strip().replace("\n", " "),
+    )
 
-        logger.info(f"Saved to notion: {database_url}")
+    return f"<b>Saved Paper🎉!</b> \n<b>{title}</b> \nAuthors: {authors}\nDate: {date}\nURL: {citation_url} \n\nNotion Database: {database_url} \nNotion Page: {page_url}."
 
-        page_url = update_response.result["url"]
-        logger.info(f"Notion Page URL: {page_url}")
 
-        title, authors, date, citation_url, abstract = (
-            paper_props["title"],
-            paper_props["authors"],
-            paper_props["date"],
-            paper_props["url"],
-            paper_props["abstract"].strip().replace("\n", " "),
+async def notify(context: ContextTypes.DEFAULT_TYPE, queued_page, text: str) -> None:
+    """Reply to the message that queued a page, if any."""
+    if queued_page.chat_id is None:
+        return
+    try:
+        await context.bot.send_message(
+            chat_id=queued_page.chat_id,
+            text=text,
+            parse_mode=ParseMode.HTML,
+            reply_to_message_id=queued_page.message_id,
+            allow_sending_without_reply=True,
         )
+    except TelegramError as e:
+        logger.error(f"Could not notify chat {queued_page.chat_id}: {e}")
 
-        await update.message.reply_html(
-            f"<b>Saved Paper🎉!</b> \n<b>{title}</b> \nAuthors: {authors}\nDate: {date}\nURL: {citation_url} \n\nNotion Database: {database_url} \nNotion Page: {page_url}."
+
+async def drain_write_queue(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Create the queued Notion pages and tell users about them."""
+    updater = context.bot_data["notion_updater"]
+    # the handlers only read the cached schema, it is refreshed here once expired
+    await updater.aget_schema()
+
+    write_queue = context.bot_data["write_queue"]
+    queued_pages = write_queue.claim(WRITE_QUEUE_BATCH_SIZE)
+    if not queued_pages:
+        return None
+
+    results = await asyncio.gather(
+        *[
+            # a failed create may have been carried out by Notion all the same
+            updater.create_queued_page(page.payload, check_existing=page.attempts > 0)
+            for page in queued_pages
+        ],
+        return_exceptions=True,
+    )
+
+    for queued_page, result in zip(queued_pages, results):
+        paper_props = queued_page.payload["paper_props"]
+
+        if not isinstance(result, Exception):
+            write_queue.complete(queued_page.id, result.result)
+            context.bot_data["paper_index"].add_page(paper_props, result.result)
+            await notify(
+                context, queued_page, saved_paper_message(paper_props, result.result)
+            )
+            continue
+
+        logger.error(f"Queued page {queued_page.id} failed: {result!r}")
+        permanent = isinstance(result, ValueError) and str(result) in PERMANENT_ERRORS
+        if permanent or queued_page.attempts + 1 >= WRITE_QUEUE_MAX_ATTEMPTS:
+            write_queue.fail(queued_page.id, repr(result))
+            await notify(
+                context,
+                queued_page,
+                f"Error while saving {html.escape(paper_props['url'])} to Notion! "
+                f"{html.escape(str(result))}",
+            )
+        else:
+            write_queue.retry(
+                queued_page.id,
+                repr(result),
+                backoff_delay(queued_page.attempts, base=5, cap=600),
+            )
+
+    return None
+
+
+async def import_papers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Import the reading list sent as a document captioned /import."""
+    document = update.message.document
+    file = await document.get_file()
+    content = bytes(await file.download_as_bytearray()).decode("utf-8", "replace")
+    references = read_reading_list(content, filename=document.file_name or "")
+    if not references:
+        await update.message.reply_text("No papers found in this file.")
+        return None
+
+    status = await update.message.reply_text(
+        f"Importing {len(references)} papers..."
+    )
+    # the import can take long, do not hold back the other updates
+    context.application.create_task(
+        run_import(
+            context,
+            references,
+            added_by=update.message.from_user.first_name,
+            status=status,
+            # sending the same file again resumes its import
+            run_id=f"telegram:{document.file_unique_id}",
+        )
+    )
+    return None
+
+
+async def run_import(
+    context: ContextTypes.DEFAULT_TYPE,
+    references: list[str],
+    added_by: str,
+    status,
+    run_id: str,
+) -> None:
+    """Run a bulk import in a worker thread, editing status with its progress."""
+    loop = asyncio.get_running_loop()
+    last_report = 0.0
+
+    def on_progress(progress: ImportProgress) -> None:
+        nonlocal last_report
+        if time.monotonic() - last_report < IMPORT_PROGRESS_INTERVAL:
+            return
+        last_report = time.monotonic()
+        asyncio.run_coroutine_threadsafe(
+            status.edit_text(f"Importing... {progress}"), loop
         )
 
+    importer = BulkImporter(
+        context.bot_data["notion_updater"],
+        context.bot_data["paper_index"],
+        added_by=added_by,
+        extraction_workers=int(
+            os.getenv("EXTRACTION_WORKERS", DEFAULT_EXTRACTION_WORKERS)
+        ),
+        on_progress=on_progress,
+        state=context.bot_data["pipeline_state"],
+    )
+    try:
+        progress = await loop.run_in_executor(None, importer.run, references, run_id)
+    except Exception as e:
+        logger.error(f"Import failed: {e!r}")
+        await status.edit_text(f"Import failed! {e}")
+        return None
+
+    failures = "\n".join(
+        f"{reference}: {error}" for reference, error in progress.failures[:10]
+    )
+    await status.edit_text(f"Import done: {progress}\n{failures}".strip())
     return None
 
 
+async def backfill_paper_index(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Index the papers already in the Notion database."""
+    updater = context.bot_data["notion_updater"]
+    database = Database(
+        integrations_token=updater.api_key,
+        timeout=updater.timeout,
+        pool_size=updater.pool_size,
+    )
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(
+            None,
+            context.bot_data["paper_index"].backfill,
+            database,
+            updater.database_id,
+        )
+    except Exception as e:
+        logger.error(f"Could not backfill the paper index: {e!r}")
+
+
+def reload_settings(application: Application) -> None:
+    """Read the Notion settings again, called on SIGHUP."""
+    try:
+        application.bot_data["notion_updater"].reload()
+    except Exception as e:
+        logger.error(f"Could not reload the Notion settings: {e!r}")
+
+
+async def post_init(application: Application) -> None:
+    """Reload the settings on SIGHUP, from the event loop."""
+    if not hasattr(signal, "SIGHUP"):
+        return
+    # unlike signal.signal, the handler runs on the loop and not in the middle
+    # of whatever the main thread holds, e.g. a lock
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGHUP, reload_settings, application
+    )
+
+
+async def post_shutdown(application: Application) -> None:
+    """Release the shared HTTP clients and the local stores."""
+    await aclose_async_clients()
+    application.bot_data["write_queue"].close()
+    application.bot_data["paper_index"].close()
+    application.bot_data["pipeline_state"].close()
+
+
+def webhook_settings() -> Dict:
+    """Arguments of Application.run_webhook, from the WEBHOOK_* variables."""
+    url_path = os.getenv("WEBHOOK_PATH", "telegram")
+    secret_token = os.getenv("WEBHOOK_SECRET")
+    if not secret_token:
+        # only Telegram learns it, through setWebhook
+        secret_token = secrets.token_urlsafe(32)
+    return {
+        "listen": os.getenv("WEBHOOK_LISTEN", DEFAULT_WEBHOOK_LISTEN),
+        "port": int(os.getenv("WEBHOOK_PORT", DEFAULT_WEBHOOK_PORT)),
+        "url_path": url_path,
+        # the public URL Telegram posts to, e.g. behind a reverse proxy
+        "webhook_url": os.getenv("WEBHOOK_URL"),
+        "secret_token": secret_token,
+        "max_connections": int(
+            os.getenv("WEBHOOK_MAX_CONNECTIONS", DEFAULT_WEBHOOK_MAX_CONNECTIONS)
+        ),
+    }
+
+
 def main() -> None:
     """Start the bot."""
-    load_dotenv()
+    # reloads read the same file, see env_file
+    load_dotenv(env_file())
     TOKEN = os.environ.get("BOT_TOKEN")
 
+    # import the paper providers once, before the first message arrives
+    get_registry()
+
     # Create the Application and pass it your bot's token.
-    application = Application.builder().token(TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(
+            int(os.getenv("CONCURRENT_UPDATES", DEFAULT_CONCURRENT_UPDATES))
+        )
+    )
+    if os.getenv("TELEGRAM_API_URL"):
+        # e.g. the fake Telegram of tools/fake_telegram.py
+        builder = builder.base_url(f"{os.environ['TELEGRAM_API_URL']}/bot")
+    application = builder.build()
 
     # on different commands - answer in Telegram
     application.add_handler(CommandHandler("start", start))
@@ -124,8 +488,39 @@ def main() -> None:
         )
     )
 
+    # on reading lists sent with the /import caption - import every paper
+    application.add_handler(
+        MessageHandler(
+            filters.Document.ALL & filters.CaptionRegex(r"^/import\b"),
+            import_papers,
+        )
+    )
+
+    # one updater for the whole process, SIGHUP reads its settings again
+    application.bot_data["notion_updater"] = NotionUpdater()
+    application.bot_data["write_queue"] = WriteQueue(
+        os.getenv("WRITE_QUEUE_PATH", DEFAULT_WRITE_QUEUE_PATH)
+    )
+    application.bot_data["paper_index"] = PaperIndex(
+        os.getenv("PAPER_INDEX_PATH", DEFAULT_PAPER_INDEX_PATH)
+    )
+    application.bot_data["pipeline_state"] = PipelineState(
+        os.getenv("PIPELINE_STATE_PATH", DEFAULT_PIPELINE_STATE_PATH)
+    )
+    application.job_queue.run_once(backfill_paper_index, 0)
+    application.job_queue.run_repeating(
+        drain_write_queue, interval=WRITE_QUEUE_INTERVAL, first=0
+    )
+
     # Run the bot until the user presses Ctrl-C
-    application.run_polling()
+    mode = os.getenv("BOT_MODE", DEFAULT_BOT_MODE)
+    if mode == "webhook":
+        application.run_webhook(**webhook_settings())
+    elif mode == "polling":
+        application.run_polling()
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {mode}, use polling or webhook")
+    get_extraction_pool().shutdown(wait=False)
 
 
 if __name__ == "__main__":
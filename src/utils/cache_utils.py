@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_DIR = ".cache"
+# one week
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# response headers kept with a cached body
+CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class CacheEntry(NamedTuple):
+    data: bytes
+    meta: dict
+    fresh: bool
+
+
+class DiskCache:
+    """
+    Size bounded on-disk cache with a TTL.
+
+    Every entry is a single file holding a JSON metadata line followed by the
+    data, written atomically. The file mtime is its last use, the least recently
+    used entries are evicted once the cache grows over max_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl: float = DEFAULT_CACHE_TTL,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        return [
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(".cache")
+        ]
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.cache")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry of key, stale entries included, or None"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                data = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        fresh = time.time() - meta["stored_at"] < self.ttl
+        return CacheEntry(data, meta, fresh)
+
+    def set(self, key: str, data: bytes, meta: Optional[dict] = None) -> None:
+        """Store data under key, stored_at is added to meta"""
+        meta = dict(meta or {}, stored_at=time.time())
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(data)
+
+        with self._lock:
+            try:
+                self._size -= os.stat(path).st_size
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+            self._size += os.stat(path).st_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as fresh again, e.g. after a 304 Not Modified"""
+        entry = self.get(key)
+        if entry is not None:
+            self.set(key, entry.data, entry.meta)
+
+    def _evict(self) -> None:
+        # evict down to 90% so that every set does not trigger a directory scan
+        target = self.max_bytes * 0.9
+        for entry in sorted(self._entries(), key=lambda e: e.stat().st_mtime):
+            if self._size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+
+
+def cached_response(url: str, entry: CacheEntry) -> requests.Response:
+    """Rebuild a requests response from a cached page"""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response.url = url
+    response._content = entry.data
+    response.headers = CaseInsensitiveDict(entry.meta.get("headers", {}))
+    response.encoding = entry.meta.get("encoding")
+    return response
+
+
+def response_meta(response: requests.Response) -> dict:
+    """Metadata stored along a cached response body"""
+    return {
+        "headers": {
+            name: response.headers[name]
+            for name in CACHED_HEADERS
+            if name in response.headers
+        },
+        "encoding": response.encoding,
+    }
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(name: str) -> Optional[DiskCache]:
+    """
+    Get the process wide cache called name, configured by PAPER_CACHE_DIR,
+    PAPER_CACHE_TTL and PAPER_CACHE_MAX_BYTES. Setting PAPER_CACHE_DIR to an
+    empty string disables caching.
+    """
+    with _CACHES_LOCK:
+        if name not in _CACHES:
+            directory = os.getenv("PAPER_CACHE_DIR", DEFAULT_CACHE_DIR)
+            _CACHES[name] = (
+                DiskCache(
+                    os.path.join(directory, name),
+                    ttl=float(os.getenv("PAPER_CACHE_TTL", DEFAULT_CACHE_TTL)),
+                    max_bytes=int(
+                        os.getenv("PAPER_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)
+                    ),
+                )
+                if directory
+                else None
+            )
+        return _CACHES[name]
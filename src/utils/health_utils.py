@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import urlparse
+
+# responses that mean the host is blocking or struggling
+FAILURE_STATUSES = (403, 429, 500, 502, 503, 504)
+DEFAULT_FAILURE_THRESHOLD = 5
+# seconds a tripped circuit stays open, doubled every time the probe fails
+DEFAULT_RESET_TIMEOUT = 30.0
+MAX_RESET_TIMEOUT = 600.0
+# read timeouts adapt to the p95 latency of the host, within these bounds
+DEFAULT_TIMEOUT = 20.0
+MIN_TIMEOUT = 3.0
+CONNECT_TIMEOUT = 5.0
+TIMEOUT_P95_FACTOR = 4
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 10
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending a request to a host that keeps failing"""
+
+
+class HostHealth:
+    """
+    Circuit breaker and latency tracking of one host.
+
+    After failure_threshold consecutive failures the circuit opens and requests
+    fail fast for reset_timeout seconds. Then a single probe request is let
+    through: success closes the circuit, failure opens it for twice as long.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        max_timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._open_for = reset_timeout
+        self._opened_until = 0.0
+        self._probe_started = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError if the host should not be requested now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            remaining = self._opened_until - now
+            # a probe that never reported back is replaced after a while
+            stale_probe = (
+                self.state == HALF_OPEN and now - self._probe_started > self._open_for
+            )
+            if (self.state == OPEN and remaining <= 0) or stale_probe:
+                # this request is the probe, the others keep failing fast
+                self.state = HALF_OPEN
+                self._probe_started = now
+                return
+        raise CircuitOpenError(
+            f"{self.host} is failing, not requested for {max(remaining, 0):.0f}s"
+        )
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self.failures = 0
+            self.state = CLOSED
+            self._open_for = self.reset_timeout
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        """Count a failure, retry_after (seconds) keeps the circuit open longer"""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self._open_for = min(self._open_for * 2, MAX_RESET_TIMEOUT)
+            elif self.failures < self.failure_threshold:
+                return
+            self.state = OPEN
+            self._opened_until = time.monotonic() + max(
+                self._open_for, retry_after or 0
+            )
+
+    def timeout(self) -> tuple[float, float]:
+        """(connect, read) timeout from the recent latencies of the host"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return (CONNECT_TIMEOUT, self.max_timeout)
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        read = min(max(p95 * TIMEOUT_P95_FACTOR, MIN_TIMEOUT), self.max_timeout)
+        return (min(CONNECT_TIMEOUT, read), read)
+
+
+_HEALTH = {}
+_HEALTH_LOCK = threading.Lock()
+
+
+def get_host_health(url: str) -> HostHealth:
+    """
+    Get the process wide health of the host of url, configured by
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT and FETCH_TIMEOUT
+    """
+    host = urlparse(url).netloc.lower()
+    with _HEALTH_LOCK:
+        health = _HEALTH.get(host)
+        if health is None:
+            health = _HEALTH[host] = HostHealth(
+                host,
+                failure_threshold=int(
+                    os.getenv("CIRCUIT_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)
+                ),
+                reset_timeout=float(
+                    os.getenv("CIRCUIT_RESET_TIMEOUT", DEFAULT_RESET_TIMEOUT)
+                ),
+                max_timeout=float(os.getenv("FETCH_TIMEOUT", DEFAULT_TIMEOUT)),
+            )
+        return health
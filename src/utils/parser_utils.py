@@ -1,7 +1,20 @@
-from typing import Dict, List
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Pattern, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from telegram import Message, MessageEntity
 
+# new style (1706.03762v5) and old style (hep-th/9901001) arXiv identifiers
+ARXIV_ID_REGEX = re.compile(
+    r"(?:arxiv\.org/(?:abs|pdf)/|arxiv:)"
+    r"(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?",
+    re.IGNORECASE,
+)
+DOI_REGEX = re.compile(r"\b(10\.\d{4,9}/[^\s?#&]+)")
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+CHARSET_REGEX = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
 
 def extract_urls(message: Message) -> List[str]:
     """
@@ -48,3 +61,124 @@ def format_author(author):
 def join_authors(authors):
     authors = [format_author(author) for author in authors]
     return ", ".join(authors)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a URL so that links to the same page compare equal:
+    https scheme, lowercase host without "www.", no fragment, no trailing slash,
+    no tracking parameters.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(
+        [
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith(TRACKING_PARAMS)
+        ]
+    )
+    return urlunsplit(("https", host, parts.path.rstrip("/"), query, ""))
+
+
+def extract_arxiv_id(text: str) -> Optional[str]:
+    """
+    Extract an arXiv identifier, without version, from an arXiv URL or an
+    "arXiv:" reference.
+    """
+    match = ARXIV_ID_REGEX.search(text)
+    return match.group(1) if match else None
+
+
+def extract_doi(text: str) -> Optional[str]:
+    """
+    Extract a DOI from a URL or a string, DOIs are case insensitive so it is lowercased.
+    """
+    match = DOI_REGEX.search(text)
+    if not match:
+        return None
+    doi = match.group(1).lower()
+    return re.sub(r"(\.pdf|/)$", "", doi)
+
+
+class _HeadFinished(Exception):
+    pass
+
+
+class MetaExtractor(HTMLParser):
+    """
+    Streaming parser collecting the <meta name=... content=...> pairs of a page in
+    a single pass. It stops at </head> (or <body>) so the rest of the document is
+    never tokenized. Data can be fed in chunks, `done` tells when to stop feeding.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pairs = []
+        self.done = False
+
+    def feed(self, data: str) -> None:
+        if self.done:
+            return
+        try:
+            super().feed(data)
+        except _HeadFinished:
+            self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            name, content = attrs.get("name"), attrs.get("content")
+            if name is not None and content is not None:
+                self.pairs.append((name, content))
+        elif tag == "body":
+            raise _HeadFinished
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            raise _HeadFinished
+
+
+class MetaIndex:
+    """
+    Lookups of meta tag contents by name, either an exact name or a compiled
+    regex searched in the name (like BeautifulSoup attribute filters).
+    Results keep document order.
+    """
+
+    def __init__(self, pairs: List[tuple]):
+        self.pairs = pairs
+        self.by_name: Dict[str, List[str]] = {}
+        for name, content in pairs:
+            self.by_name.setdefault(name, []).append(content)
+
+    @classmethod
+    def from_html(cls, html: str) -> "MetaIndex":
+        extractor = MetaExtractor()
+        extractor.feed(html)
+        return cls(extractor.pairs)
+
+    def find_all(self, name: Union[str, Pattern]) -> List[str]:
+        if isinstance(name, str):
+            return self.by_name.get(name, [])
+        return [content for key, content in self.pairs if name.search(key)]
+
+    def find(self, name: Union[str, Pattern]) -> Optional[str]:
+        contents = self.find_all(name)
+        return contents[0] if contents else None
+
+
+def decode_html(content: bytes, encoding: Optional[str] = None) -> str:
+    """
+    Decode an HTML document using the charset of its headers, of its <meta> tags
+    or utf-8, in that order.
+    """
+    if encoding is None:
+        match = CHARSET_REGEX.search(content[:2048])
+        encoding = match.group(1).decode() if match else "utf-8"
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
@@ -0,0 +1,176 @@
+import os
+import random
+import threading
+import time
+from typing import Iterable, Optional
+
+# a proxy failing that many times in a row is evicted for EVICTION_TIME seconds
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_EVICTION_TIME = 300.0
+# smoothing of the latency average, and its value before the first response
+LATENCY_EWMA_ALPHA = 0.2
+INITIAL_LATENCY = 1.0
+DIRECT = "direct"
+
+
+class ProxyStats:
+    """Latency and error counts of one proxy"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = INITIAL_LATENCY
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.evicted_until = 0.0
+
+    @property
+    def score(self) -> float:
+        """Selection weight: fast proxies that rarely fail score higher"""
+        success_rate = (self.successes + 1) / (self.successes + self.failures + 2)
+        return success_rate / max(self.latency, 0.01)
+
+
+class ProxyPool:
+    """
+    Pool of proxies picked at random, weighted by their score.
+
+    Proxies that keep failing are evicted for a while. Hosts whose requests carry
+    cookies stick to the proxy they were first sent through, since a session
+    cookie seen from another address may be rejected.
+    """
+
+    def __init__(
+        self,
+        proxies: Iterable[str],
+        sticky_hosts: Iterable[str] = (),
+        max_failures: int = DEFAULT_MAX_FAILURES,
+        eviction_time: float = DEFAULT_EVICTION_TIME,
+        fallback_direct: bool = True,
+    ):
+        self.stats = {url: ProxyStats(url) for url in proxies}
+        self.sticky_hosts = set(sticky_hosts)
+        self.max_failures = max_failures
+        self.eviction_time = eviction_time
+        self.fallback_direct = fallback_direct
+        self._assignments = {}
+        self._lock = threading.Lock()
+
+    def choose(
+        self, host: str, sticky: bool = False, exclude: Iterable[str] = ()
+    ) -> Optional[str]:
+        """Pick a proxy for a request to host
+
+        Args:
+            host (str): the requested host
+            sticky (bool): keep the host on the same proxy, also when host is in
+                sticky_hosts
+            exclude (Iterable[str]): proxies already tried for this request
+        Returns:
+            str: a proxy URL, None to connect directly
+        """
+        exclude = {proxy or DIRECT for proxy in exclude}
+        sticky = sticky or host in self.sticky_hosts
+        now = time.monotonic()
+        with self._lock:
+            alive = [
+                stats
+                for url, stats in self.stats.items()
+                if stats.evicted_until <= now and url not in exclude
+            ]
+            assigned = self._assignments.get(host)
+            if sticky and assigned in {stats.url for stats in alive}:
+                return None if assigned == DIRECT else assigned
+            if not alive:
+                return None if self.fallback_direct else self._least_evicted(exclude)
+
+            (stats,) = random.choices(alive, weights=[s.score for s in alive])
+            if sticky:
+                self._assignments[host] = stats.url
+        return None if stats.url == DIRECT else stats.url
+
+    def has_alternative(self, exclude: Iterable[str]) -> bool:
+        """Whether another route than exclude is left: a proxy that is not
+        evicted, or connecting directly when fallback_direct is set"""
+        exclude = {proxy or DIRECT for proxy in exclude}
+        if self.fallback_direct and DIRECT not in exclude:
+            return True
+        now = time.monotonic()
+        return any(
+            stats.evicted_until <= now
+            for url, stats in self.stats.items()
+            if url not in exclude
+        )
+
+    def _least_evicted(self, exclude: set) -> Optional[str]:
+        candidates = [s for url, s in self.stats.items() if url not in exclude]
+        if not candidates:
+            return None
+        url = min(candidates, key=lambda s: s.evicted_until).url
+        return None if url == DIRECT else url
+
+    def record_success(self, proxy: Optional[str], latency: float) -> None:
+        stats = self.stats.get(proxy or DIRECT)
+        if stats is None:
+            return
+        with self._lock:
+            stats.latency += LATENCY_EWMA_ALPHA * (latency - stats.latency)
+            stats.successes += 1
+            stats.consecutive_failures = 0
+
+    def record_failure(self, proxy: Optional[str]) -> None:
+        stats = self.stats.get(proxy or DIRECT)
+        if stats is None:
+            return
+        with self._lock:
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.max_failures:
+                stats.evicted_until = time.monotonic() + self.eviction_time
+                stats.consecutive_failures = 0
+                # sticky hosts move to another proxy
+                for host, assigned in list(self._assignments.items()):
+                    if assigned == stats.url:
+                        del self._assignments[host]
+
+    @staticmethod
+    def proxies(proxy: Optional[str]) -> dict:
+        """requests proxies argument for a proxy chosen by choose"""
+        return {"http": proxy, "https": proxy}
+
+
+_proxy_pool = None
+_proxy_pool_lock = threading.Lock()
+
+
+def get_proxy_pool() -> Optional[ProxyPool]:
+    """
+    Get the process wide ProxyPool, None when no proxy is configured.
+
+    PROXIES is a comma separated list of proxy URLs ("direct" for no proxy), the
+    single PROXY variable is still read. PROXY_STICKY_HOSTS lists hosts kept on
+    one proxy, PROXY_MAX_FAILURES and PROXY_EVICTION_TIME tune the eviction.
+    """
+    global _proxy_pool
+    with _proxy_pool_lock:
+        if _proxy_pool is None:
+            proxies = [
+                proxy.strip()
+                for proxy in os.getenv("PROXIES", os.getenv("PROXY", "")).split(",")
+                if proxy.strip()
+            ]
+            if not proxies:
+                return None
+            _proxy_pool = ProxyPool(
+                proxies,
+                sticky_hosts=[
+                    host.strip().lower()
+                    for host in os.getenv("PROXY_STICKY_HOSTS", "").split(",")
+                    if host.strip()
+                ],
+                max_failures=int(os.getenv("PROXY_MAX_FAILURES", DEFAULT_MAX_FAILURES)),
+                eviction_time=float(
+                    os.getenv("PROXY_EVICTION_TIME", DEFAULT_EVICTION_TIME)
+                ),
+            )
+        return _proxy_pool
@@ -1,7 +1,18 @@
 import os
 import random
+import threading
+import time
+from contextlib import nullcontext
+from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+from src.utils.cache_utils import cached_response, response_meta
+from src.utils.health_utils import FAILURE_STATUSES, get_host_health
+from src.utils.proxy_utils import get_proxy_pool
+from src.utils.retry_utils import backoff_delay, retry_after_delay
 
 # list of most common user agents (Last Updated: Wed, 09 Sep 2020)
 USER_AGENTS = [
@@ -102,6 +113,91 @@ common_headers = [
     ("Connection", "keep-alive"),
 ]
 
+# head-only downloads stop after this many bytes even if </head> was not seen
+DEFAULT_HEAD_MAX_BYTES = 512 * 1024
+HEAD_CHUNK_SIZE = 16 * 1024
+HEAD_END_MARKERS = (b"</head>", b"<body")
+# the rest of a head-only download is read to keep the connection when it is
+# this small, reopening the connection costs more than reading it
+DEFAULT_HEAD_DRAIN_MAX_BYTES = 64 * 1024
+# retries of failed fetches, and the bounds of the backoff between them
+DEFAULT_FETCH_RETRIES = 2
+FETCH_BACKOFF_BASE = 1.0
+FETCH_BACKOFF_CAP = 10.0
+# errors worth another attempt, e.g. not TooManyRedirects or InvalidURL
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
+# responses that are blamed on the proxy rather than on the host
+PROXY_FAILURE_STATUSES = (403, 407, 429)
+# concurrent requests (and pooled connections) per publisher host
+DEFAULT_HOST_MAX_CONCURRENCY = 4
+
+
+def read_head(response, max_bytes=DEFAULT_HEAD_MAX_BYTES, chunk_size=HEAD_CHUNK_SIZE):
+    """
+    Read a streamed HTML response up to the end of its <head>, or max_bytes
+
+    :param response: a response requested with stream=True
+    :param max_bytes: maximum number of (decoded) bytes to read
+    :param chunk_size: size of the chunks read from the connection
+    :return: the bytes read, cut after the end of the head when it was found
+    """
+    content = bytearray()
+    for chunk in response.iter_content(chunk_size):
+        # markers may be split between two chunks
+        search_from = max(0, len(content) - len(b"</head>"))
+        content += chunk
+        window = bytes(content[search_from:]).lower()
+        ends = [window.find(marker) for marker in HEAD_END_MARKERS]
+        ends = [end for end in ends if end != -1]
+        if ends:
+            return bytes(content[: search_from + min(ends)]) + b"</head>"
+        if len(content) >= max_bytes:
+            break
+    return bytes(content[:max_bytes])
+
+
+def release_stream(response, max_bytes=DEFAULT_HEAD_DRAIN_MAX_BYTES):
+    """
+    Hand the connection of a partly read streamed response back to the pool
+
+    The rest of the body is read and dropped when no more than max_bytes are
+    left, otherwise the connection is closed rather than downloading it.
+
+    :param response: a response requested with stream=True
+    :param max_bytes: largest remainder (bytes on the wire) read to keep the
+        connection
+    :return: True when the connection went back to the pool
+    """
+    raw = response.raw
+    if not hasattr(raw, "release_conn"):
+        # not a urllib3 response, e.g. from a test adapter
+        response.close()
+        return False
+    try:
+        length = int(response.headers.get("Content-Length", ""))
+    except ValueError:
+        length = None
+    if length is not None and length - raw.tell() > max_bytes:
+        response.close()
+        return False
+    limit = raw.tell() + max_bytes
+    try:
+        # without Content-Length the remainder is only known once read
+        while raw.read(HEAD_CHUNK_SIZE, decode_content=True):
+            if raw.tell() > limit:
+                response.close()
+                return False
+    except (Urllib3HTTPError, OSError):
+        response.close()
+        return False
+    raw.release_conn()
+    return True
+
 
 class DefaultSession(requests.Session):
 
@@ -113,38 +209,241 @@ class DefaultSession(requests.Session):
 
         super(DefaultSession, self).__init__()
 
-        PROXY = os.getenv("PROXY")
-
-        if PROXY is not None:
-
-            self.proxies = {"http": PROXY, "https": PROXY}
+        self.proxy_pool = kwargs.get("proxy_pool", get_proxy_pool())
 
         self.headers.update({"User-Agent": random.choice(USER_AGENTS)})
         self.headers.update(dict(common_headers))
         self.headers.update(kwargs.get("headers", {}))
-        self.default_timeout = 20
+        self.max_retries = kwargs.get("max_retries", DEFAULT_FETCH_RETRIES)
+        self.cache = kwargs.get("cache")
+        self.head_max_bytes = kwargs.get("head_max_bytes", DEFAULT_HEAD_MAX_BYTES)
+        self.head_drain_max_bytes = kwargs.get(
+            "head_drain_max_bytes", DEFAULT_HEAD_DRAIN_MAX_BYTES
+        )
 
-    def request(self, method, url, **kwargs):
+        # caps the concurrent GETs of this session, with a pool to match
+        max_concurrency = kwargs.get("max_concurrency")
+        self.slots = None
+        if max_concurrency:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+            self.mount("https://", adapter)
+            self.mount("http://", adapter)
+            self.slots = threading.BoundedSemaphore(max_concurrency)
+
+    def get(self, url, head_only=False, **kwargs):
+        """
+        GET through the response cache when one is configured: fresh pages are
+        served from disk, stale ones are revalidated with a conditional request
+
+        With head_only the body is streamed and only its <head> is downloaded,
+        see get_head. A cache given as keyword argument replaces the session one.
         """
-        This is just a common request, the only difference is that when proxies are provided
-        and a response isn't ok, we'll try one more time without using the proxies
+        cache = kwargs.pop("cache", self.cache)
+        if cache is None:
+            return self._get(url, head_only, **kwargs)
+
+        cache_key = f"head:{url}" if head_only else url
+        entry = cache.get(cache_key)
+        if entry is not None and entry.fresh:
+            return cached_response(url, entry)
+
+        if entry is not None:
+            headers = dict(kwargs.pop("headers", None) or {})
+            cached_headers = entry.meta.get("headers", {})
+            if "ETag" in cached_headers:
+                headers["If-None-Match"] = cached_headers["ETag"]
+            if "Last-Modified" in cached_headers:
+                headers["If-Modified-Since"] = cached_headers["Last-Modified"]
+            kwargs["headers"] = headers
+
+        response = self._get(url, head_only, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            cache.touch(cache_key)
+            return cached_response(url, entry)
+        if response.status_code == 200:
+            cache.set(cache_key, response.content, response_meta(response))
+        return response
+
+    def _get(self, url, head_only=False, **kwargs):
+        # the slot is held until the (head of the) body is read
+        with self.slots or nullcontext():
+            if head_only:
+                return self.get_head(url, **kwargs)
+            return super().get(url, **kwargs)
+
+    def get_head(self, url, max_bytes=None, **kwargs):
         """
+        GET an HTML page but stop reading the body once its <head> is complete
 
-        kwargs["timeout"] = kwargs.get("timeout", self.default_timeout)
+        A small rest of the body is drained so the connection is reused, the
+        connection of a large article page is closed instead of downloading it
+        (see release_stream and head_drain_max_bytes).
 
+        :param url: page URL
+        :param max_bytes: byte cap, defaults to head_max_bytes
+        :return: a response whose content is the head of the page
+        """
+        kwargs["stream"] = True
+        response = super().get(url, **kwargs)
+        if response.status_code != 200:
+            try:
+                response._content = response.content
+            finally:
+                response.close()
+            return response
         try:
-            response = super().request(method, url, **kwargs)
-        except Exception:
-            response = requests.Response()
-            response.status_code = 500
-
-        if not response.ok and ("http" in self.proxies or "https" in self.proxies):
-            # if the response is not ok using proxies,
-            # let's try one more time without using them
-            kwargs["proxies"] = {
-                "http": None,
-                "https": None,
-            }
-            response = super().request(method, url, **kwargs)
+            response._content = read_head(
+                response, max_bytes=max_bytes or self.head_max_bytes
+            )
+        except BaseException:
+            response.close()
+            raise
+        release_stream(response, max_bytes=self.head_drain_max_bytes)
+        return response
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the circuit breaker of its host
+
+        Connection errors, timeouts, 429 and 5xx responses are retried with
+        jittered exponential backoff. Hosts that keep failing raise
+        CircuitOpenError right away, and the timeout follows the latency observed
+        for the host unless one is given.
+
+        With a proxy pool every attempt goes through another proxy, and requests
+        sending cookies keep the proxy of their host. A 403 is only retried when
+        another proxy, or the direct connection, is left since it usually blocks
+        the address.
+        """
+        health = get_host_health(url)
+        kwargs.setdefault("timeout", health.timeout())
+        host = urlparse(url).netloc.lower()
+        sticky = bool((kwargs.get("headers") or {}).get("Cookie"))
+        tried = []
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            health.before_request()
+            proxy = None
+            if self.proxy_pool is not None and "proxies" not in kwargs:
+                proxy = self.proxy_pool.choose(host, sticky=sticky, exclude=tried)
+                tried.append(proxy)
+                proxies = self.proxy_pool.proxies(proxy)
+            else:
+                proxies = kwargs.get("proxies")
+
+            start = time.monotonic()
+            try:
+                attempt_kwargs = {**kwargs, "proxies": proxies}
+                response = super().request(method, url, **attempt_kwargs)
+            except BaseException as e:
+                # every exit is recorded, a probe must not leave the circuit half open
+                health.record_failure()
+                self._record_proxy(proxy, failed=True)
+                if last_attempt or not isinstance(e, RETRY_EXCEPTIONS):
+                    raise
+                delay = backoff_delay(attempt, FETCH_BACKOFF_BASE, FETCH_BACKOFF_CAP)
+                time.sleep(delay)
+                continue
+
+            latency = time.monotonic() - start
+            failed = response.status_code in PROXY_FAILURE_STATUSES
+            self._record_proxy(proxy, failed, latency)
+            if response.status_code not in FAILURE_STATUSES:
+                health.record_success(latency)
+                return response
+
+            retry_after = retry_after_delay(response.headers)
+            health.record_failure(retry_after)
+            # a 403 is a block (e.g. Cloudflare), only another address may help
+            if last_attempt or (
+                response.status_code == 403
+                and not (self.proxy_pool and self.proxy_pool.has_alternative(tried))
+            ):
+                return response
+            response.close()
+            if response.status_code == 403:
+                continue
+            delay = backoff_delay(attempt, FETCH_BACKOFF_BASE, FETCH_BACKOFF_CAP)
+            time.sleep(min(max(delay, retry_after or 0), FETCH_BACKOFF_CAP))
 
         return response
+
+    def _record_proxy(self, proxy, failed, latency=None):
+        """Score the proxy of an attempt, when it came from the pool"""
+        if self.proxy_pool is None:
+            return
+        if failed:
+            self.proxy_pool.record_failure(proxy)
+        else:
+            self.proxy_pool.record_success(proxy, latency)
+
+
+class SessionManager:
+    """
+    Process wide sessions, one per host
+
+    Consecutive fetches from the same publisher reuse its warm keep-alive
+    connections, and no more than max_concurrency of them run at once. Provider
+    headers are not part of the sessions: pass them with every request.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_HOST_MAX_CONCURRENCY, host_limits=None):
+        """
+        :param max_concurrency: concurrent requests per host
+        :param host_limits: dict of host to its own concurrency cap
+        """
+        self.max_concurrency = max_concurrency
+        self.host_limits = host_limits or {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        """
+        Get the session of the host of url, creating it on first use
+
+        :param url: any URL of the host
+        :return: DefaultSession
+        """
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = DefaultSession(
+                    max_concurrency=self.host_limits.get(host, self.max_concurrency)
+                )
+                self._sessions[host] = session
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_session_manager = None
+_session_manager_lock = threading.Lock()
+
+
+def get_session_manager():
+    """
+    Get the process wide SessionManager, configured by HOST_MAX_CONCURRENCY and
+    HOST_CONCURRENCY_LIMITS (e.g. "dl.acm.org=2,www.pnas.org=2")
+    """
+    global _session_manager
+    with _session_manager_lock:
+        if _session_manager is None:
+            host_limits = {}
+            for limit in os.getenv("HOST_CONCURRENCY_LIMITS", "").split(","):
+                if "=" in limit:
+                    host, value = limit.split("=", 1)
+                    host_limits[host.strip().lower()] = int(value)
+            _session_manager = SessionManager(
+                max_concurrency=int(
+                    os.getenv("HOST_MAX_CONCURRENCY", DEFAULT_HOST_MAX_CONCURRENCY)
+                ),
+                host_limits=host_limits,
+            )
+        return _session_manager
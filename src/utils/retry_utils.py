@@ -0,0 +1,41 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+
+
+def backoff_delay(attempt, base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_CAP):
+    """
+    Exponential backoff with full jitter
+
+    :param attempt: number of the failed attempt, starting at 0
+    :param base: delay of the first retry
+    :param cap: maximum delay
+    :return:
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def retry_after_delay(headers):
+    """
+    Parse a Retry-After header, given either in seconds or as an HTTP date
+
+    :param headers: response headers
+    :return: seconds to wait, None when the header is missing or invalid
+    """
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
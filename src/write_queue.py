@@ -0,0 +1,196 @@
+"""Durable queue of Notion pages waiting to be created.
+
+Pages are written to a local SQLite file first and created in Notion by a
+background worker, so a slow or unavailable Notion does not reach the user
+and queued pages survive a restart.
+
+@author: @steppf
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, NamedTuple, Optional
+
+DEFAULT_WRITE_QUEUE_PATH = "write_queue.sqlite3"
+
+PENDING, IN_PROGRESS, DONE, FAILED = "pending", "in_progress", "done", "failed"
+
+
+class QueuedPage(NamedTuple):
+    id: int
+    payload: dict
+    chat_id: Optional[int]
+    message_id: Optional[int]
+    attempts: int
+
+
+class WriteQueue:
+    """SQLite backed queue of page bodies."""
+
+    def __init__(self, path: str = DEFAULT_WRITE_QUEUE_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                chat_id INTEGER,
+                message_id INTEGER,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS pages_status ON pages (status, next_attempt_at)"
+        )
+        # paper keys of the pages not yet created, to recognize a paper shared
+        # again before its page exists
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS page_keys (
+                key TEXT NOT NULL,
+                page_id INTEGER NOT NULL,
+                PRIMARY KEY (key, page_id)
+            )
+            """
+        )
+        # Pages claimed by a worker that died before finishing are retried
+        self._conn.execute(
+            "UPDATE pages SET status = ? WHERE status = ?", (PENDING, IN_PROGRESS)
+        )
+
+    def put(
+        self,
+        payload: dict,
+        chat_id: Optional[int] = None,
+        message_id: Optional[int] = None,
+        keys: Iterable[str] = (),
+    ) -> int:
+        """Add a page to the queue
+
+        Args:
+            payload (dict): the page body and the data needed to answer the user
+            chat_id (int): chat to reply to once the page is created
+            message_id (int): message to reply to once the page is created
+            keys (Iterable[str]): keys the page is found under by lookup_keys
+                until it is created
+        Returns:
+            int: the id of the queued page
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO pages (payload, chat_id, message_id, status, "
+                    "next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (json.dumps(payload), chat_id, message_id, PENDING, now, now),
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO page_keys (key, page_id) VALUES (?, ?)",
+                    [(key, cursor.lastrowid) for key in keys],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.lastrowid
+
+    def lookup_keys(self, keys: list[str]) -> Optional[int]:
+        """Find a page not yet created that was queued under any of keys
+
+        Args:
+            keys (list[str]): keys given to put
+        Returns:
+            int: the id of the queued page or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pages.id FROM page_keys JOIN pages ON pages.id = page_id "
+                f"WHERE key IN ({', '.join('?' * len(keys))}) "
+                "AND status IN (?, ?) LIMIT 1",
+                [*keys, PENDING, IN_PROGRESS],
+            ).fetchone()
+        return row[0] if row else None
+
+    def claim(self, limit: int) -> list[QueuedPage]:
+        """Take up to limit pages that are due and mark them in progress
+
+        Args:
+            limit (int): maximum number of pages
+        Returns:
+            list[QueuedPage]: the claimed pages, oldest first
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload, chat_id, message_id, attempts FROM pages "
+                    "WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                    (PENDING, time.time(), limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE pages SET status = ? WHERE id = ?",
+                    [(IN_PROGRESS, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return [
+            QueuedPage(id, json.loads(payload), chat_id, message_id, attempts)
+            for id, payload, chat_id, message_id, attempts in rows
+        ]
+
+    def complete(self, page_id: int, result: dict) -> None:
+        """Mark a queued page as created in Notion"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET status = ?, result = ?, error = NULL WHERE id = ?",
+                (DONE, json.dumps(result), page_id),
+            )
+            self._conn.execute("DELETE FROM page_keys WHERE page_id = ?", (page_id,))
+
+    def retry(self, page_id: int, error: str, delay: float) -> None:
+        """Put a queued page back to be tried again after delay seconds"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET status = ?, attempts = attempts + 1, error = ?, "
+                "next_attempt_at = ? WHERE id = ?",
+                (PENDING, error, time.time() + delay, page_id),
+            )
+
+    def fail(self, page_id: int, error: str) -> None:
+        """Give up on a queued page"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET status = ?, attempts = attempts + 1, error = ? "
+                "WHERE id = ?",
+                (FAILED, error, page_id),
+            )
+            self._conn.execute("DELETE FROM page_keys WHERE page_id = ?", (page_id,))
+
+    def pending_count(self) -> int:
+        """Number of pages not yet created"""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM pages WHERE status IN (?, ?)",
+                (PENDING, IN_PROGRESS),
+            ).fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
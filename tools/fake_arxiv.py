@@ -0,0 +1,238 @@
+"""Local stand-in of the arXiv Atom export API.
+
+Answers id_list queries like export.arxiv.org/api/query: every well formed
+identifier is a made up paper, except the ones declared unknown, which are left
+out of the feed. Malformed identifiers come back as an "Error" entry, like on
+arXiv. Latency and 503 responses can be injected to exercise the batching of
+ArxivAPI and the fallback to the abs pages.
+
+    python -m tools.fake_arxiv --unknown 2101.00001 --error-rate 0.2
+    ARXIV_API_URL=http://127.0.0.1:8083/api/query python import_papers.py papers.txt
+
+It also runs in process:
+
+    with FakeArxivServer(unknown={"2101.00001"}) as arxiv:
+        os.environ["ARXIV_API_URL"] = arxiv.api_url
+        ...
+    print(arxiv.arxiv.queries)
+
+@author: @steppf
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+DEFAULT_PORT = 8083
+# the export API returns 10 results unless max_results says otherwise
+DEFAULT_MAX_RESULTS = 10
+ARXIV_ID_REGEX = re.compile(
+    r"^(?:\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?$"
+)
+VERSION_REGEX = re.compile(r"v\d+$")
+
+logger = logging.getLogger("fake_arxiv")
+
+
+class FakeArxiv:
+    """
+    Papers of the fake export API, with the faults injected before every query.
+
+    :param unknown: identifiers missing from arXiv
+    :param latency: seconds every response is delayed by
+    :param error_rate: fraction of the queries answered 503
+    :param retry_after: Retry-After of the 503 responses, in seconds
+    """
+
+    def __init__(
+        self, unknown=(), latency=0.0, error_rate=0.0, retry_after=3, seed=None
+    ):
+        self.unknown = set(unknown)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        # id_list of every query, to check the batching
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def query(self, params):
+        """
+        Answer a query
+
+        :param params: query parameters
+        :return: (status, headers, body)
+        """
+        id_list = [i for i in params.get("id_list", "").split(",") if i]
+        with self._lock:
+            self.queries.append(id_list)
+            draw = self.random.random()
+        if self.latency:
+            time.sleep(self.latency)
+        if draw < self.error_rate:
+            return 503, {"Retry-After": str(self.retry_after)}, b"Service Unavailable"
+
+        max_results = int(params.get("max_results") or DEFAULT_MAX_RESULTS)
+        entries = []
+        for arxiv_id in id_list:
+            if not ARXIV_ID_REGEX.match(arxiv_id):
+                entries.append(self.error_entry(arxiv_id))
+            elif VERSION_REGEX.sub("", arxiv_id) not in self.unknown:
+                entries.append(self.entry(arxiv_id))
+        headers = {"Content-Type": "application/atom+xml; charset=utf-8"}
+        return 200, headers, self.feed(id_list, entries[:max_results])
+
+    @staticmethod
+    def entry(arxiv_id):
+        title = f"Paper {arxiv_id}"
+        return f"""  <entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <updated>2017-12-06T18:56:58Z</updated>
+    <published>2017-06-12T17:57:34Z</published>
+    <title>{escape(title)}:
+  a Fake Title on Two Lines</title>
+    <summary>  The abstract of {escape(arxiv_id)},
+  wrapped like the real ones.
+</summary>
+    <author>
+      <name>Jane Smith</name>
+    </author>
+    <author>
+      <name>John Doe</name>
+    </author>
+    <arxiv:doi>10.48550/arXiv.{escape(arxiv_id)}</arxiv:doi>
+    <link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://arxiv.org/pdf/{arxiv_id}v1" rel="related" type="application/pdf"/>
+    <arxiv:primary_category term="cs.CL" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>
+"""
+
+    @staticmethod
+    def error_entry(arxiv_id):
+        return f"""  <entry>
+    <id>http://arxiv.org/api/errors#incorrect_id_format_for_{escape(arxiv_id)}</id>
+    <title>Error</title>
+    <summary>incorrect id format for {escape(arxiv_id)}</summary>
+    <updated>2017-12-06T00:00:00-05:00</updated>
+    <author>
+      <name>arXiv api core</name>
+    </author>
+  </entry>
+"""
+
+    @staticmethod
+    def feed(id_list, entries):
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <link href="http://arxiv.org/api/query?id_list={escape(",".join(id_list))}" rel="self" type="application/atom+xml"/>
+  <title type="html">ArXiv Query: id_list={escape(",".join(id_list))}</title>
+  <id>http://arxiv.org/api/fake</id>
+  <updated>2017-12-06T00:00:00-05:00</updated>
+  <opensearch:totalResults>{len(entries)}</opensearch:totalResults>
+  <opensearch:startIndex>0</opensearch:startIndex>
+  <opensearch:itemsPerPage>{len(entries)}</opensearch:itemsPerPage>
+{"".join(entries)}</feed>
+""".encode()
+
+
+def make_handler(arxiv: FakeArxiv):
+    class ArxivAPIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/api/query":
+                status, headers, body = 404, {}, b"Not Found"
+            else:
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                status, headers, body = arxiv.query(params)
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return ArxivAPIHandler
+
+
+class FakeArxivServer:
+    """
+    FakeArxiv served over HTTP from a background thread
+
+    :param port: port to listen on, a free one if 0
+    :param kwargs: unknown identifiers and faults, see FakeArxiv
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **kwargs):
+        self.arxiv = FakeArxiv(**kwargs)
+        self.server = ThreadingHTTPServer((host, port), make_handler(self.arxiv))
+        self.server.daemon_threads = True
+
+    @property
+    def api_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/query"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Serve a fake arXiv export API until interrupted."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--unknown", nargs="*", default=[], help="identifiers missing from arXiv"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction of queries answered 503"
+    )
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server = FakeArxivServer(
+        port=args.port,
+        unknown=args.unknown,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ).start()
+    print(f"Fake arXiv API on {server.api_url}")
+    try:
+        while True:
+            time.sleep(10)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        queries = server.arxiv.queries
+        print(json.dumps({"queries": len(queries), "ids": sum(map(len, queries))}))
+
+
+if __name__ == "__main__":
+    main()
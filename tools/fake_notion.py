@@ -0,0 +1,577 @@
+"""Local stand-in of the Notion API to load test the bot and the importer.
+
+Serves the endpoints the clients of src/notion_database call, from memory:
+pages create/retrieve/update, database retrieve and query (with cursors), block
+retrieve, children list and append, and search. Latency, rate limiting, random
+429 and 5xx responses can be injected to tune concurrency and the rate limiter.
+
+    python -m tools.fake_notion --latency 0.2 --rate-limit 3 --error-rate 0.02
+    NOTION_BASE_URL=http://127.0.0.1:8082/v1 python import_papers.py papers.txt
+
+It also runs in process:
+
+    with FakeNotionServer(latency=0.05, throttle_rate=0.1) as notion:
+        os.environ["NOTION_BASE_URL"] = notion.base_url
+        ...
+    print(notion.notion.stats())
+
+@author: @steppf
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8082
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 100
+# columns of the papers database, see NotionUpdater.COLUMN_TYPES
+DEFAULT_SCHEMA = {
+    "Type": "select",
+    "Name": "title",
+    "Authors": "multi_select",
+    "Link": "url",
+    "Publication Date": "rich_text",
+    "Abstract": "rich_text",
+    "Added By": "rich_text",
+    "Date Added": "rich_text",
+}
+ERROR_STATUSES = (500, 502, 503)
+ERROR_CODES = {
+    400: "validation_error",
+    404: "object_not_found",
+    429: "rate_limited",
+    500: "internal_server_error",
+    502: "bad_gateway",
+    503: "service_unavailable",
+}
+
+logger = logging.getLogger("fake_notion")
+
+
+class NotionError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+    def to_dict(self):
+        return {
+            "object": "error",
+            "status": self.status,
+            "code": ERROR_CODES.get(self.status, "internal_server_error"),
+            "message": self.message,
+        }
+
+
+def now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def plain_text(value):
+    """Text of a property value, to filter and search on"""
+    kind = value.get("type") or next(
+        (key for key in value if key not in ("id", "type")), None
+    )
+    content = value.get(kind)
+    if isinstance(content, list):
+        return "".join(
+            item.get("text", {}).get("content", "") or item.get("name", "")
+            for item in content
+        )
+    if isinstance(content, dict):
+        return content.get("name", "")
+    return "" if content is None else str(content)
+
+
+def property_value(value):
+    """Property value as Notion returns it: typed, with plain_text on texts"""
+    kind = value.get("type") or next(key for key in value if key != "id")
+    value = {"type": kind, **value}
+    if kind in ("title", "rich_text"):
+        value[kind] = [
+            {
+                "type": "text",
+                **item,
+                "plain_text": item.get("text", {}).get("content", ""),
+            }
+            for item in value[kind]
+        ]
+    return value
+
+
+class FakeNotion:
+    """
+    In memory Notion workspace, with the faults injected before every call.
+
+    :param latency: seconds every response is delayed by
+    :param jitter: random extra delay, up to that many seconds
+    :param rate_limit: requests per second allowed (averaged over a second),
+        0 for no limit
+    :param throttle_rate: fraction of the requests answered 429 at random
+    :param error_rate: fraction of the requests answered 500, 502 or 503
+    :param retry_after: Retry-After of the 429 responses, in seconds
+    :param schema: column name to type of the databases created on first use
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        rate_limit=0.0,
+        throttle_rate=0.0,
+        error_rate=0.0,
+        retry_after=1,
+        schema=None,
+        seed=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.schema = schema or DEFAULT_SCHEMA
+        self.random = random.Random(seed)
+        self.pages = {}
+        self.databases = {}
+        self.blocks = {}
+        self.children = {}
+        self.requests = Counter()
+        self.statuses = Counter()
+        self._window = []
+        self._lock = threading.RLock()
+
+    # faults
+
+    def inject_faults(self):
+        """Delay the call, then raise the error it was picked for, if any"""
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            if self.rate_limit:
+                current = time.monotonic()
+                self._window = [t for t in self._window if current - t < 1]
+                if len(self._window) >= self.rate_limit:
+                    self._throttle()
+                self._window.append(current)
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            self._throttle()
+        if draw < self.throttle_rate + self.error_rate:
+            status = self.random.choice(ERROR_STATUSES)
+            raise NotionError(status, "Injected error")
+
+    def _throttle(self):
+        raise NotionError(
+            429,
+            "You have been rate limited. Please try again in a few minutes.",
+            {"Retry-After": str(self.retry_after)},
+        )
+
+    def stats(self):
+        """Requests by endpoint and responses by status"""
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "statuses": {str(k): v for k, v in self.statuses.items()},
+                "pages": len(self.pages),
+                "blocks": len(self.blocks),
+            }
+
+    # objects
+
+    def database(self, database_id):
+        """Get a database, created with the default schema on first use"""
+        database_id = database_id.replace("-", "")
+        with self._lock:
+            if database_id not in self.databases:
+                self.databases[database_id] = {
+                    "object": "database",
+                    "id": database_id,
+                    "created_time": now(),
+                    "last_edited_time": now(),
+                    "title": [{"type": "text", "text": {"content": "Papers"}}],
+                    "parent": {"type": "workspace", "workspace": True},
+                    "properties": {
+                        name: {"id": str(i), "name": name, "type": kind, kind: {}}
+                        for i, (name, kind) in enumerate(self.schema.items())
+                    },
+                }
+            return self.databases[database_id]
+
+    def page(self, page_id):
+        page = self.pages.get(page_id.replace("-", ""))
+        if page is None:
+            raise NotionError(404, f"Could not find page with ID: {page_id}.")
+        return page
+
+    def create_page(self, body):
+        parent = body.get("parent") or {}
+        if "database_id" in parent:
+            schema = self.database(parent["database_id"])["properties"]
+            unknown = set(body.get("properties") or {}) - set(schema)
+            if unknown:
+                raise NotionError(
+                    400, f"{', '.join(sorted(unknown))} is not a property that exists."
+                )
+            for name, value in (body.get("properties") or {}).items():
+                kind = schema[name]["type"]
+                if kind not in value:
+                    raise NotionError(400, f"{name} is expected to be {kind}.")
+        page_id = uuid.uuid4().hex
+        page = {
+            "object": "page",
+            "id": page_id,
+            "created_time": now(),
+            "last_edited_time": now(),
+            "archived": False,
+            "parent": parent,
+            "properties": {
+                name: property_value(value)
+                for name, value in (body.get("properties") or {}).items()
+            },
+            "url": f"https://www.notion.so/{page_id}",
+        }
+        with self._lock:
+            self.pages[page_id] = page
+            self.children[page_id] = []
+        self.append_children(page_id, {"children": body.get("children") or []})
+        return page
+
+    def update_page(self, page_id, body):
+        with self._lock:
+            page = self.page(page_id)
+            for name, value in (body.get("properties") or {}).items():
+                page["properties"][name] = property_value(value)
+            if "archived" in body:
+                page["archived"] = body["archived"]
+            page["last_edited_time"] = now()
+            return page
+
+    def query_database(self, database_id, body):
+        self.database(database_id)
+        database_id = database_id.replace("-", "")
+        with self._lock:
+            pages = [
+                page
+                for page in self.pages.values()
+                if (page["parent"].get("database_id") or "").replace("-", "")
+                == database_id
+                and not page["archived"]
+                and self._matches(page, body.get("filter"))
+            ]
+        for sort in reversed(body.get("sorts") or []):
+            key = sort.get("timestamp") or sort.get("property")
+            pages.sort(
+                key=lambda page: page.get(key)
+                or plain_text(page["properties"].get(key, {})),
+                reverse=sort.get("direction") == "descending",
+            )
+        return self._paginate(pages, body)
+
+    def _matches(self, page, filter):
+        if not filter:
+            return True
+        if "and" in filter:
+            return all(self._matches(page, sub) for sub in filter["and"])
+        if "or" in filter:
+            return any(self._matches(page, sub) for sub in filter["or"])
+        value = page["properties"].get(filter.get("property"), {})
+        text = plain_text(value) if value else ""
+        condition = next(
+            (v for k, v in filter.items() if k not in ("property", "type")), {}
+        )
+        if "equals" in condition:
+            return text == str(condition["equals"])
+        if "contains" in condition:
+            return str(condition["contains"]).lower() in text.lower()
+        if "is_empty" in condition:
+            return not text
+        if "is_not_empty" in condition:
+            return bool(text)
+        raise NotionError(400, f"Unsupported filter: {json.dumps(filter)}")
+
+    def search(self, body):
+        query = (body.get("query") or "").lower()
+        kind = (body.get("filter") or {}).get("value")
+        with self._lock:
+            objects = []
+            if kind in (None, "page"):
+                objects += [
+                    page
+                    for page in self.pages.values()
+                    if query in self._title(page).lower()
+                ]
+            if kind in (None, "database"):
+                objects += [
+                    database
+                    for database in self.databases.values()
+                    if query in plain_text({"title": database["title"]}).lower()
+                ]
+        if (body.get("sort") or {}).get("direction") == "descending":
+            objects.reverse()
+        return self._paginate(objects, body)
+
+    @staticmethod
+    def _title(page):
+        for value in page["properties"].values():
+            if "title" in value:
+                return plain_text({"title": value["title"]})
+        return ""
+
+    def block(self, block_id):
+        block_id = block_id.replace("-", "")
+        if block_id in self.pages:
+            return {"object": "block", "id": block_id, "type": "child_page"}
+        block = self.blocks.get(block_id)
+        if block is None:
+            raise NotionError(404, f"Could not find block with ID: {block_id}.")
+        return block
+
+    def list_children(self, block_id, params):
+        self.block(block_id)
+        with self._lock:
+            ids = self.children.get(block_id.replace("-", ""), [])
+            blocks = [self.blocks[id] for id in ids]
+        return self._paginate(blocks, params)
+
+    def append_children(self, block_id, body):
+        children = body.get("children") or []
+        if len(children) > MAX_PAGE_SIZE:
+            raise NotionError(
+                400, f"body.children.length should be ≤ `{MAX_PAGE_SIZE}`."
+            )
+        parent_id = block_id.replace("-", "")
+        self.block(parent_id)
+        created = []
+        with self._lock:
+            siblings = self.children.setdefault(parent_id, [])
+            position = len(siblings)
+            if body.get("after"):
+                after = body["after"].replace("-", "")
+                if after not in siblings:
+                    raise NotionError(400, f"{after} is not a child of {parent_id}")
+                position = siblings.index(after) + 1
+            for child in children:
+                block = dict(child)
+                block.update(
+                    {
+                        "object": "block",
+                        "id": uuid.uuid4().hex,
+                        "parent": {"type": "block_id", "block_id": parent_id},
+                        "created_time": now(),
+                        "has_children": False,
+                        "archived": False,
+                    }
+                )
+                self.blocks[block["id"]] = block
+                created.append(block)
+            siblings[position:position] = [block["id"] for block in created]
+        return {"object": "list", "results": created, "has_more": False}
+
+    @staticmethod
+    def _paginate(objects, body):
+        """Notion list object of a page of objects, the cursor is an index"""
+        page_size = min(int(body.get("page_size") or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+        start = int(body.get("start_cursor") or 0)
+        end = start + page_size
+        return {
+            "object": "list",
+            "results": objects[start:end],
+            "has_more": end < len(objects),
+            "next_cursor": str(end) if end < len(objects) else None,
+        }
+
+    # routing
+
+    ROUTES = [
+        ("POST", re.compile(r"^/pages/?$"), "create_page"),
+        ("GET", re.compile(r"^/pages/(?P<id>[\w-]+)$"), "retrieve_page"),
+        ("PATCH", re.compile(r"^/pages/(?P<id>[\w-]+)$"), "update_page"),
+        ("GET", re.compile(r"^/databases/(?P<id>[\w-]+)$"), "retrieve_database"),
+        ("POST", re.compile(r"^/databases/(?P<id>[\w-]+)/query$"), "query_database"),
+        ("GET", re.compile(r"^/blocks/(?P<id>[\w-]+)$"), "retrieve_block"),
+        ("GET", re.compile(r"^/blocks/(?P<id>[\w-]+)/children$"), "list_children"),
+        ("PATCH", re.compile(r"^/blocks/(?P<id>[\w-]+)/children$"), "append_children"),
+        ("POST", re.compile(r"^/search/?$"), "search"),
+    ]
+
+    def call(self, method, path, params, body):
+        """
+        Answer an API call, the path relative to /v1
+
+        :return: (status, headers, decoded response)
+        """
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            return 400, {}, NotionError(400, f"Invalid request URL: {path}").to_dict()
+
+        with self._lock:
+            self.requests[name] += 1
+        try:
+            self.inject_faults()
+            object_id = match.groupdict().get("id")
+            if name == "create_page":
+                result = self.create_page(body)
+            elif name == "retrieve_page":
+                result = self.page(object_id)
+            elif name == "update_page":
+                result = self.update_page(object_id, body)
+            elif name == "retrieve_database":
+                result = self.database(object_id)
+            elif name == "query_database":
+                result = self.query_database(object_id, body)
+            elif name == "retrieve_block":
+                result = self.block(object_id)
+            elif name == "list_children":
+                result = self.list_children(object_id, params)
+            elif name == "append_children":
+                result = self.append_children(object_id, body)
+            else:
+                result = self.search(body)
+            status, headers = 200, {}
+        except NotionError as e:
+            status, headers, result = e.status, e.headers, e.to_dict()
+        with self._lock:
+            self.statuses[status] += 1
+        return status, headers, result
+
+
+def make_handler(notion: FakeNotion):
+    class NotionAPIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.handle_call("GET")
+
+        def do_POST(self):
+            self.handle_call("POST")
+
+        def do_PATCH(self):
+            self.handle_call("PATCH")
+
+        def handle_call(self, method):
+            url = urlparse(self.path)
+            path = url.path[len("/v1") :] if url.path.startswith("/v1") else url.path
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            except ValueError:
+                status, headers = 400, {}
+                result = NotionError(400, "Error parsing JSON body.").to_dict()
+            else:
+                status, headers, result = notion.call(method, path, params, body)
+
+            data = json.dumps(result).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return NotionAPIHandler
+
+
+class FakeNotionServer:
+    """
+    FakeNotion served over HTTP from a background thread
+
+    :param port: port to listen on, a free one if 0
+    :param kwargs: faults and schema, see FakeNotion
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **kwargs):
+        self.notion = FakeNotion(**kwargs)
+        self.server = ThreadingHTTPServer((host, port), make_handler(self.notion))
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Serve a fake Notion API until interrupted."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="random extra latency, in seconds"
+    )
+    parser.add_argument(
+        "--rate-limit", type=float, default=0, help="requests per second, 0 for none"
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0, help="fraction answered 429"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction answered 5xx"
+    )
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server = FakeNotionServer(
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    ).start()
+    print(f"Fake Notion API on {server.base_url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(server.notion.stats()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.notion.stats()))
+
+
+if __name__ == "__main__":
+    main()
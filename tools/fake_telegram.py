@@ -0,0 +1,206 @@
+"""Local fake of Telegram to drive the bot in webhook mode.
+
+Serves the few Bot API methods the bot calls (getMe, setWebhook, sendMessage...)
+and pushes updates to the webhook the bot registers, like Telegram does. The
+replies of the bot are printed and the latency of every webhook call is reported.
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook python main.py
+    python -m tools.fake_telegram --message "https://arxiv.org/abs/1706.03762"
+
+@author: @steppf
+"""
+import argparse
+import itertools
+import json
+import logging
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+
+DEFAULT_PORT = 8081
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+USER = {"id": 2, "is_bot": False, "first_name": "Tester"}
+CHAT = {"id": 2, "type": "private", "first_name": "Tester"}
+URL_REGEX = re.compile(r"https?://\S+")
+
+logger = logging.getLogger("fake_telegram")
+
+
+class FakeTelegram:
+    """State of the fake Bot API: the registered webhook and the messages sent."""
+
+    def __init__(self) -> None:
+        self.webhook_url = None
+        self.secret_token = None
+        self.webhook_set = threading.Event()
+        self.sent: list[dict] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def call(self, method: str, params: dict):
+        """Answer a Bot API call, returns the result field of the response"""
+        method = method.lower()
+        if method == "getme":
+            return BOT_USER
+        if method == "setwebhook":
+            self.webhook_url = params.get("url")
+            self.secret_token = params.get("secret_token")
+            self.webhook_set.set()
+            return True
+        if method in ("sendmessage", "editmessagetext"):
+            message = {
+                "message_id": int(params.get("message_id") or self.next_id()),
+                "date": int(time.time()),
+                "chat": CHAT,
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+            with self._lock:
+                self.sent.append(message)
+            print(f"<- {method}: {message['text']}")
+            return message
+        # deleteWebhook, setMyCommands...
+        return True
+
+    def update(self, text: str) -> dict:
+        """A Telegram update of a private message, URLs tagged as entities"""
+        entities = [
+            {
+                "type": "url",
+                "offset": len(text[: match.start()].encode("utf-16-le")) // 2,
+                "length": len(match.group().encode("utf-16-le")) // 2,
+            }
+            for match in URL_REGEX.finditer(text)
+        ]
+        if text.startswith("/"):
+            command = text.split()[0]
+            entities.append(
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            )
+        return {
+            "update_id": self.next_id(),
+            "message": {
+                "message_id": self.next_id(),
+                "date": int(time.time()),
+                "chat": CHAT,
+                "from": USER,
+                "text": text,
+                "entities": entities,
+            },
+        }
+
+
+def make_handler(telegram: FakeTelegram):
+    class BotAPIHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.do_GET()
+
+        def do_GET(self):
+            # /bot<token>/<method>
+            method = self.path.rstrip("/").rsplit("/", 1)[-1].split("?")[0]
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode() if length else ""
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params = json.loads(body or "{}")
+            else:
+                params = {key: values[0] for key, values in parse_qs(body).items()}
+            data = json.dumps({"ok": True, "result": telegram.call(method, params)})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data.encode())))
+            self.end_headers()
+            self.wfile.write(data.encode())
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return BotAPIHandler
+
+
+def push_updates(
+    telegram: FakeTelegram, messages: list[str], concurrency: int
+) -> list[float]:
+    """Post an update per message to the webhook, returns the latencies"""
+    session = requests.Session()
+    headers = {"Content-Type": "application/json"}
+    if telegram.secret_token:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = telegram.secret_token
+
+    def push(text):
+        start = time.perf_counter()
+        response = session.post(
+            telegram.webhook_url,
+            data=json.dumps(telegram.update(text)),
+            headers=headers,
+            timeout=30,
+        )
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(push, messages))
+
+
+def main():
+    """Fake Telegram: serve the Bot API and push messages to the bot webhook."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--message", action="append", default=[], help="text of a message to send"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="send every message n times"
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--webhook-url", help="push to this URL instead of waiting for setWebhook"
+    )
+    parser.add_argument("--secret-token", help="webhook secret, with --webhook-url")
+    parser.add_argument(
+        "--wait", type=float, default=5, help="seconds to wait for the replies"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    telegram = FakeTelegram()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(telegram))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Fake Bot API on http://127.0.0.1:{args.port}")
+
+    if args.webhook_url:
+        telegram.webhook_url = args.webhook_url
+        telegram.secret_token = args.secret_token
+    else:
+        print("Waiting for the bot to call setWebhook...")
+        telegram.webhook_set.wait()
+    print(f"Webhook: {telegram.webhook_url}")
+
+    messages = args.message * args.repeat
+    if messages:
+        latencies = push_updates(telegram, messages, args.concurrency)
+        print(
+            json.dumps(
+                {
+                    "updates": len(latencies),
+                    "p50_ms": statistics.median(latencies) * 1000,
+                    "max_ms": max(latencies) * 1000,
+                }
+            )
+        )
+    time.sleep(args.wait)
+    server.shutdown()
+    print(f"{len(telegram.sent)} messages sent by the bot")
+
+
+if __name__ == "__main__":
+    main()